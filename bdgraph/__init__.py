@@ -9,4 +9,15 @@ from bdgraph.option import Option
 from bdgraph.node_option import NodeOption
 from bdgraph.graph_option import GraphOption
 from bdgraph.node import Node
+from bdgraph.source import Source
+from bdgraph.source import SourceCache
+from bdgraph.reachability import Reachability
+from bdgraph.render import Renderer
+from bdgraph.budget import Budget
+from bdgraph.summary import Summarizer
+from bdgraph.diff import Diff
+from bdgraph.store import Store
+from bdgraph.layout import Layout
+from bdgraph.export import Exporter
 from bdgraph.graph import Graph
+from bdgraph.reference import Reference
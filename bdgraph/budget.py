@@ -0,0 +1,66 @@
+#!/usr/bin/python3
+''' budget.py
+
+Description:
+    Limits on how long the expensive graph operations may run, and a way to
+    stop them from another thread. Operations that are cut short leave the
+    graph valid, just less reduced or less compressed, and set
+    Graph.truncated
+
+        budget = bdgraph.Budget(seconds=2)
+        graph.transitive_reduction(budget)
+        graph.compress_representation(budget)   # shares what's left
+'''
+
+import threading
+import time
+
+
+class Budget(object):
+    ''' Class
+
+    A time limit, a step limit, and a cancellation token. Any of them may be
+    used alone. A step is roughly one node or relationship visited. Once the
+    budget runs out it stays out, so one Budget can cap several operations
+    in a row '''
+
+    def __init__(self, seconds=None, steps=None):
+        ''' number, int -> Budget
+
+        @seconds    time allowed from now, no limit if None
+        @steps      steps allowed, no limit if None '''
+
+        self.deadline = None
+        if seconds is not None:
+            self.deadline = time.monotonic() + seconds
+
+        self.steps = steps
+        self.spent = 0
+        self.exhausted = False
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        ''' none -> none
+
+        stops whatever is using this budget at its next check. safe to call
+        from any thread '''
+
+        self.cancelled.set()
+
+    def spend(self, steps=1):
+        ''' int -> bool
+
+        records work done, returns whether there's any budget left '''
+
+        self.spent += steps
+
+        if self.exhausted:
+            return False
+
+        if (self.cancelled.is_set() or
+                (self.steps is not None and self.spent > self.steps) or
+                (self.deadline is not None and
+                 time.monotonic() > self.deadline)):
+            self.exhausted = True
+
+        return not self.exhausted
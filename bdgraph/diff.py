@@ -0,0 +1,255 @@
+#!/usr/bin/python3
+''' diff.py
+
+Description:
+    Compares two revisions of a graph by their structure rather than their
+    text. Each node gets hashes that only change when the node or its
+    neighborhood does:
+
+        content     label, description, flag and weight
+        structure   content, plus the content of every parent and child
+
+    Nodes are matched in passes: by label when their content is the same,
+    then by structure and then content without labels, which pairs up nodes
+    that were only renumbered, like by cleanup. Nodes left over with the same
+    label are changed, the rest were added or removed
+
+    Both are cheap to compute, O(V + E) with a sort of each node's neighbors,
+    and stable between runs, so they also make good cache keys
+'''
+
+import bdgraph
+import hashlib
+import io
+
+
+class Diff(object):
+    ''' Class
+
+    The differences between an old and a new Graph, and a graphviz drawing
+    of both with the differences highlighted '''
+
+    colors = {
+        'added': 'palegreen',
+        'removed': 'lightcoral',
+        'changed': 'gold',
+    }
+
+    def __init__(self, old, new):
+        ''' Graph, Graph -> Diff
+
+        added, removed and changed are lists of labels, in the order of the
+        graph they're from; changed by their new label. added_edges and
+        removed_edges are lists of (providing label, requiring label), by
+        new and old label. matched maps the old label of every node that's
+        still there to its new label '''
+
+        self.old = old
+        self.new = new
+        self.matched = {}       # dict of string: string
+
+        old_content = Diff.content_hashes(old, labels=False)
+        new_content = Diff.content_hashes(new, labels=False)
+
+        for label in new_content:
+            if label in old_content and \
+                    old_content[label] == new_content[label]:
+                self.matched[label] = label
+
+        for old_hashes, new_hashes in (
+                (Diff.structural_hashes(old, labels=False),
+                 Diff.structural_hashes(new, labels=False)),
+                (old_content, new_content)):
+            self.pair(old_hashes, new_hashes)
+
+        # whatever is left with the same label was edited in place
+        taken = set(self.matched.values())
+        self.changed = [label for label in new_content
+                        if label in old_content and label not in taken and
+                        label not in self.matched]
+
+        for label in self.changed:
+            self.matched[label] = label
+
+        taken = set(self.matched.values())
+        self.added = [_ for _ in new_content if _ not in taken]
+        self.removed = [_ for _ in old_content if _ not in self.matched]
+
+        old_edges = Diff.edge_labels(old)
+        new_edges = Diff.edge_labels(new)
+        kept = set((self.matched.get(parent), self.matched.get(child))
+                   for parent, child in old_edges)
+        new_set = set(new_edges)
+
+        self.added_edges = [_ for _ in new_edges if _ not in kept]
+        self.removed_edges = [
+            (parent, child) for parent, child in old_edges
+            if (self.matched.get(parent), self.matched.get(child))
+            not in new_set]
+
+    def pair(self, old_hashes, new_hashes):
+        ''' dict of string: string, dict of string: string -> none
+
+        matches the nodes of each graph that aren't matched yet and have the
+        same hash, in the order of the graphs '''
+
+        taken = set(self.matched.values())
+        waiting = {}        # dict of string: list of string, hash to labels
+
+        for label in old_hashes:
+            if label not in self.matched:
+                waiting.setdefault(old_hashes[label], []).append(label)
+
+        for label in new_hashes:
+            candidates = waiting.get(new_hashes[label])
+            if label not in taken and candidates:
+                self.matched[candidates.pop(0)] = label
+
+    def empty(self):
+        ''' none -> bool
+
+        are the graphs the same? '''
+
+        return not (self.added or self.removed or self.changed or
+                    self.added_edges or self.removed_edges)
+
+    def summary(self):
+        ''' none -> string
+
+        one line describing the size of the differences '''
+
+        return '+%d -%d ~%d nodes, +%d -%d edges' % (
+            len(self.added), len(self.removed), len(self.changed),
+            len(self.added_edges), len(self.removed_edges))
+
+    def write_dot(self, file_name):
+        ''' string -> bool, IO
+
+        @file_name  name of the output graphviz file to write
+
+        writes the drawing of the differences, only replacing the file if its
+        contents changed. returns whether it was '''
+
+        return bdgraph.Renderer.write_if_changed(file_name, self.format_dot())
+
+    def format_dot(self):
+        ''' none -> string
+
+        both graphs in graphviz dot format. added nodes are green, removed
+        ones red and changed ones gold; added relationships are green, and
+        removed ones red and dashed. nodes are named by label, since their
+        numbers differ between the graphs '''
+
+        old_nodes = {node.label: node for node in self.old.nodes}
+        new_nodes = {node.label: node for node in self.new.nodes}
+
+        state = {}
+        for label in self.added:
+            state[new_nodes[label]] = 'added'
+        for label in self.changed:
+            state[new_nodes[label]] = 'changed'
+        for label in self.removed:
+            state[old_nodes[label]] = 'removed'
+
+        # every node of the new graph, then the ones that are gone
+        removed_nodes = [old_nodes[_] for _ in self.removed]
+        nodes = self.new.nodes + removed_nodes
+
+        added = set(self.added_edges)
+        removed = set(self.removed_edges)
+
+        name = {node: '"%s (%s)"' % (node.pretty_desc, node.label)
+                for node in self.new.nodes}
+        names = set(name.values())
+
+        for node in removed_nodes:
+            name[node] = '"%s (%s)"' % (node.pretty_desc, node.label)
+            if name[node] in names:
+                name[node] = '"%s (old %s)"' % (node.pretty_desc, node.label)
+
+        # matched nodes go by their new description, even in old edges
+        for old_label, new_label in self.matched.items():
+            name[old_nodes[old_label]] = name[new_nodes[new_label]]
+
+        with io.StringIO() as fd:
+            fd.write('digraph g{\n'
+                     '  rankdir=LR;\n'
+                     '  ratio=fill;\n'
+                     '  node [style=filled];\n'
+                     '  overlap=false;\n')
+
+            for node in nodes:
+                color = Diff.colors.get(state.get(node), 'white')
+                fd.write('  %s [color="%s"]\n' % (name[node], color))
+
+            for parent, child in self.new.edges():
+                style = ''
+                if (parent.label, child.label) in added:
+                    style = ' [color="forestgreen", penwidth=2]'
+
+                fd.write('  %s -> %s%s\n' % (name[parent], name[child], style))
+
+            for parent, child in self.old.edges():
+                if (parent.label, child.label) in removed:
+                    fd.write('  %s -> %s [color="red", style=dashed]\n' % (
+                        name[parent], name[child]))
+
+            fd.write('}\n')
+            return fd.getvalue()
+
+    @staticmethod
+    def edge_labels(graph):
+        ''' Graph -> list of (string, string)
+
+        every relationship in the graph, by label '''
+
+        return [(parent.label, child.label) for parent, child in graph.edges()]
+
+    @staticmethod
+    def digest(*parts):
+        ''' string... -> string
+
+        hash of the parts given, which may not contain a NUL '''
+
+        return hashlib.sha256('\0'.join(parts).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def content_hashes(graph, labels=True):
+        ''' Graph, bool -> dict of string: string
+
+        @labels     whether the label is part of the content
+
+        label to content hash for every node. generated flags, like the ones
+        from color_next, aren't part of the content '''
+
+        result = {}
+
+        for node in graph.nodes:
+            flag = node.node_option.flag if node.node_option else ''
+            weight = '%r' % node.weight if node.weight is not None else ''
+            result[node.label] = Diff.digest(
+                node.label if labels else '', flag, node.description, weight)
+
+        return result
+
+    @staticmethod
+    def structural_hashes(graph, labels=True):
+        ''' Graph, bool -> dict of string: string
+
+        @labels     whether labels are part of the content
+
+        label to structure hash for every node. a node's hash changes when
+        it changes, when it gains or loses a parent or child, or when one of
+        its parents or children changes '''
+
+        content = Diff.content_hashes(graph, labels)
+        children, parents = graph.adjacency()
+        result = {}
+
+        for node in graph.nodes:
+            result[node.label] = Diff.digest(
+                content[node.label],
+                ','.join(sorted(content[_.label] for _ in parents[node])),
+                ','.join(sorted(content[_.label] for _ in children[node])))
+
+        return result
@@ -0,0 +1,178 @@
+#!/usr/bin/python3
+''' export.py
+
+Description:
+    Writes graphs in formats meant for other programs rather than graphviz,
+    so they don't have to pick apart dot files. Output is written a record at
+    a time through a buffered file, never built up as one string
+
+        jsonl   JSON Lines. one graph record, then one record per node, then
+                one per relationship:
+
+                {"type": "graph", "options": [...], "nodes": 9, "edges": 9,
+                 "has_cycle": false, "reduced": true, "truncated": false}
+                {"type": "node", "label": "6", "number": "6",
+                 "description": "Go to the store", "option": "color_complete",
+                 "flag": "@", "weight": null, "critical": false,
+                 "component": 5, "cyclic": false}
+                {"type": "edge", "from": "6", "to": "8", "cyclic": false}
+
+        tsv     an edge list with a header row. the options of both nodes,
+                and the component of relationships that are part of a cycle.
+                tabs, newlines and backslashes in labels are escaped with a
+                backslash
+
+                from    to    from_option    to_option    component
+
+    Relationships go from the node providing to the node requiring. Nodes are
+    numbered by strongly connected component in topological order, so
+    relationships only go from lower to higher components, or within one.
+    Components with more than one node, or a node that requires itself, are
+    cycles
+'''
+
+import bdgraph
+import json
+
+
+class Exporter(object):
+    ''' Class
+
+    Writes one Graph in the formats above '''
+
+    def __init__(self, graph):
+        ''' Graph -> Exporter '''
+
+        self.graph = graph
+        self.component = {}     # dict of Node: int
+        self.cyclic = set()     # set of int, components that are cycles
+
+        components = graph.strongly_connected_components()
+
+        for number, nodes in enumerate(components):
+            for node in nodes:
+                self.component[node] = number
+
+            if len(nodes) > 1:
+                self.cyclic.add(number)
+
+        self.edges = graph.edges()
+
+        for parent, child in self.edges:
+            if parent is child:
+                self.cyclic.add(self.component[parent])
+
+    def write_jsonl(self, file_name):
+        ''' string -> bool, IO
+
+        @file_name  name of the output file to write
+
+        writes the graph as JSON Lines. the file is only replaced if its
+        contents changed, returns whether it was '''
+
+        return bdgraph.Renderer.stream_if_changed(file_name, self.jsonl)
+
+    def write_tsv(self, file_name):
+        ''' string -> bool, IO
+
+        @file_name  name of the output file to write
+
+        writes the graph as a tab separated edge list. the file is only
+        replaced if its contents changed, returns whether it was '''
+
+        return bdgraph.Renderer.stream_if_changed(file_name, self.tsv)
+
+    def jsonl(self, fd):
+        ''' file descriptor -> IO
+
+        see write_jsonl() '''
+
+        graph = self.graph
+
+        if bdgraph.Option.Critical in graph.option_strings:
+            graph.mark_critical_path()
+
+        Exporter.record(fd, {
+            'type': 'graph',
+            'options': graph.option_strings,
+            'nodes': len(graph.nodes),
+            'edges': len(self.edges),
+            'has_cycle': graph.has_cycle or bool(self.cyclic),
+            'reduced': graph.reduced,
+            'truncated': graph.truncated,
+        })
+
+        for node in graph.nodes:
+            component = self.component[node]
+
+            Exporter.record(fd, {
+                'type': 'node',
+                'label': node.label,
+                'number': node.number,
+                'description': node.description,
+                'option': Exporter.option(node),
+                'flag': node.node_option.flag if node.node_option else '',
+                'weight': node.weight,
+                'critical': node.critical,
+                'component': component,
+                'cyclic': component in self.cyclic,
+            })
+
+        for parent, child in self.edges:
+            Exporter.record(fd, {
+                'type': 'edge',
+                'from': parent.label,
+                'to': child.label,
+                'cyclic': self.within_cycle(parent, child),
+            })
+
+    def tsv(self, fd):
+        ''' file descriptor -> IO
+
+        see write_tsv() '''
+
+        fd.write('from\tto\tfrom_option\tto_option\tcomponent\n')
+
+        for parent, child in self.edges:
+            component = ''
+            if self.within_cycle(parent, child):
+                component = str(self.component[parent])
+
+            fd.write('%s\t%s\t%s\t%s\t%s\n' % (
+                Exporter.field(parent.label), Exporter.field(child.label),
+                Exporter.option(parent) or '',
+                Exporter.option(child) or '', component))
+
+    def within_cycle(self, parent, child):
+        ''' Node, Node -> bool
+
+        is the relationship part of a cycle? '''
+
+        component = self.component[parent]
+        return component == self.component[child] and component in self.cyclic
+
+    @staticmethod
+    def option(node):
+        ''' Node -> string | None
+
+        name of the node's option, like color_complete '''
+
+        return node.node_option.type if node.node_option else None
+
+    @staticmethod
+    def field(text):
+        ''' string -> string
+
+        text escaped for a TSV field '''
+
+        return (text.replace('\\', '\\\\').replace('\t', '\\t')
+                .replace('\n', '\\n').replace('\r', '\\r'))
+
+    @staticmethod
+    def record(fd, fields):
+        ''' file descriptor, dict -> IO
+
+        writes one JSON Lines record '''
+
+        fd.write(json.dumps(fields, ensure_ascii=False))
+        fd.write('\n')
@@ -0,0 +1,219 @@
+#!/usr/bin/python3
+''' fuzz.py
+
+Description:
+    Differential fuzzing of the optimized graph operations against the
+    reference versions in bdgraph.Reference. Random graphs, with and without
+    cycles, go through handle_options, transitive_reduction and
+    compress_representation both ways. Each stage must keep the same
+    reachability between nodes, and give the same write_dot and write_config
+    output as the reference. Reduction of a cyclic graph is the exception:
+    the reference reduces part of it before finding the cycle, so only
+    reachability is compared there, and compression starts from a copy of
+    the optimized result
+
+Usage:
+    python3 -m bdgraph.fuzz [cases [seed [size]]]
+'''
+
+import bdgraph
+import random
+import sys
+import time
+
+
+class Fuzzer(object):
+    ''' Class
+
+    Generates random graphs and compares both implementations on them,
+    keeping every mismatch found and the time spent in each '''
+
+    stages = ['handle_options', 'transitive_reduction',
+              'compress_representation']
+
+    # removing marked nodes changes reachability on purpose
+    preserving = ['transitive_reduction', 'compress_representation']
+
+    def __init__(self, seed=0, size=30, edges=None):
+        ''' int, int, int -> Fuzzer
+
+        @seed   first seed, each case uses the next one
+        @size   number of nodes in each graph
+        @edges  number of relationships in each graph, twice size if None '''
+
+        self.seed = seed
+        self.size = size
+        self.edges = edges or 2 * size
+        self.failures = []          # list of string
+        self.timings = {stage: [0.0, 0.0] for stage in Fuzzer.stages}
+
+    def run(self, cases):
+        ''' int -> list of string
+
+        checks cases random graphs, alternating between DAGs and graphs with
+        cycles. returns the failures found so far '''
+
+        for case in range(cases):
+            seed = self.seed + case
+            contents = self.generate(seed, cyclic=bool(case % 2))
+            self.check(contents, 'seed %d' % seed)
+
+        return self.failures
+
+    def generate(self, seed, cyclic=False):
+        ''' int, bool -> string
+
+        a random graph in the input format. nodes get random flags and the
+        graph random options, so handle_options has something to do. DAG
+        edges follow a shuffled order, so the definitions aren't already
+        sorted '''
+
+        rng = random.Random(seed)
+        order = list(range(1, self.size + 1))
+        rng.shuffle(order)
+
+        definitions = []
+        for label in range(1, self.size + 1):
+            flag = rng.choice(['', '', '', '@', '!', '&'])
+            definitions.append('%d: %snode %d' % (label, flag, label))
+
+        options = [option for option in (bdgraph.Option.Next,
+                                         bdgraph.Option.Complete,
+                                         bdgraph.Option.Urgent,
+                                         bdgraph.Option.Remove,
+                                         bdgraph.Option.Publish,
+                                         bdgraph.Option.Critical)
+                   if rng.random() < 0.5]
+
+        dependencies = []
+        for _ in range(self.edges):
+            if cyclic:
+                a, b = rng.randint(1, self.size), rng.randint(1, self.size)
+            else:
+                a, b = sorted(rng.sample(range(self.size), 2))
+                a, b = order[a], order[b]
+
+            dependencies.append('%d -> %d' % (a, b))
+
+        return '\n'.join(definitions + ['', 'options', ' '.join(options),
+                                        '', 'dependencies'] + dependencies)
+
+    def check(self, contents, name='graph'):
+        ''' string, string -> bool
+
+        runs every stage both ways on the graph given, recording mismatches
+        under name. returns whether there were none '''
+
+        before = len(self.failures)
+        reference = bdgraph.Graph(contents)
+        optimized = bdgraph.Graph(contents)
+
+        for stage in Fuzzer.stages:
+            # a partially reduced graph can't be compared, start from ours
+            if stage == 'compress_representation' and optimized.has_cycle:
+                reference = bdgraph.Reference(optimized).copy()
+
+            if stage in Fuzzer.preserving:
+                expected = Fuzzer.closure(optimized)
+
+            self.time(stage, 0, getattr(bdgraph.Reference(reference), stage))
+            self.time(stage, 1, getattr(optimized, stage))
+
+            for graph, which in ((reference, 'reference'),
+                                 (optimized, 'optimized')):
+                if (stage in Fuzzer.preserving and
+                        Fuzzer.closure(graph) != expected):
+                    self.fail(name, stage, which + ' changed reachability')
+
+            if stage == 'transitive_reduction':
+                if reference.has_cycle != optimized.has_cycle:
+                    self.fail(name, stage, 'cycle detection differs')
+
+                if optimized.has_cycle:
+                    continue
+
+            if reference.format_dot() != optimized.format_dot():
+                self.fail(name, stage, 'write_dot output differs')
+
+            if reference.format_config() != optimized.format_config():
+                self.fail(name, stage, 'write_config output differs')
+
+        return len(self.failures) == before
+
+    def time(self, stage, which, function):
+        ''' string, int, function -> none
+
+        runs function, adding the time taken to the stage's timings '''
+
+        start = time.perf_counter()
+        function()
+        self.timings[stage][which] += time.perf_counter() - start
+
+    def fail(self, name, stage, message):
+        ''' string, string, string -> none '''
+
+        self.failures.append('%s: %s: %s' % (name, stage, message))
+
+    def report(self):
+        ''' none -> string
+
+        the failures found, then the total time per stage for both versions
+        and the speedup of the optimized one '''
+
+        lines = list(self.failures)
+        lines.append('%-24s %12s %12s %9s' % (
+            'stage', 'reference', 'optimized', 'speedup'))
+
+        for stage in Fuzzer.stages:
+            reference, optimized = self.timings[stage]
+            speedup = reference / optimized if optimized else float('inf')
+            lines.append('%-24s %11.4fs %11.4fs %8.1fx' % (
+                stage, reference, optimized, speedup))
+
+        return '\n'.join(lines)
+
+    @staticmethod
+    def closure(graph):
+        ''' Graph -> set of (string, string)
+
+        every (providing, requiring) pair of labels where the second
+        transitively requires the first. works on compressed graphs too '''
+
+        children, _ = graph.adjacency()
+        result = set()
+
+        for node in graph.nodes:
+            seen = set()
+            todo = list(children[node])
+
+            while todo:
+                current = todo.pop()
+                if current not in seen:
+                    seen.add(current)
+                    todo.extend(children[current])
+
+            result.update((node.label, other.label) for other in seen)
+
+        return result
+
+
+def main(argv):
+    ''' list of string -> none '''
+
+    try:
+        cases, seed, size = [int(_) for _ in argv] + [100, 0, 30][len(argv):]
+
+    except ValueError:
+        print('usage: python3 -m bdgraph.fuzz [cases [seed [size]]]')
+        sys.exit(1)
+
+    fuzzer = Fuzzer(seed, size)
+    fuzzer.run(cases)
+    print(fuzzer.report())
+
+    if fuzzer.failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
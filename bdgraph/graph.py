@@ -13,9 +13,11 @@ Usage:
 '''
 
 import bdgraph
-import copy
-import inspect
-import sys
+import collections
+import concurrent.futures
+import heapq
+import io
+import os
 
 
 class Graph(object):
@@ -24,73 +26,249 @@ class Graph(object):
     The Graph class encapsulates everything about the input file, internal
     representation, and handles parsing options, and writing output files '''
 
-    def __init__(self, contents, logging=False):
-        ''' string, bool -> Graph
+    def __init__(self, contents, logging=False, directory='.', cache=None,
+                 workers=None):
+        ''' string, bool, string, SourceCache, int -> Graph
+
+        @directory  where included files are looked for
+        @cache      parsed files to reuse, see bdgraph.SourceCache
+        @workers    number of threads parsing included files
 
         construct a Graph object, handles parsing the input file to create
         internal representation and options list '''
 
-        # clean input, convert to list of lines, remove comments
-        contents = [line.strip() for line in contents.split('\n')]
-        contents = [line for line in contents if line and line[0] != '#']
+        cache = cache or bdgraph.SourceCache()
+        root = cache.parse(contents)
 
-        self.contents = contents        # list of string
+        self.contents = root.lines      # list of string
         self.nodes = []                 # list of Node
+        self.labels = {}                # dict of string: Node
         self.graph_options = []         # list of Graph_Option
         self.option_strings = []        # list of string
+        self.included = []              # list of string, included files
         self.logging = logging          # bool
         self.has_cycle = False          # bool
+        self.reachability = None        # Reachability
+        self.reduced = False            # bool
+        self.compressed = False         # bool
+        self.truncated = False          # bool, an operation was cut short
+        self.dropped = {}               # dict of Node: set of Node, given
+                                        # relationships reduction removed
+        self.node_counter = 1           # next Node.number to hand out
+        self.clusters = False           # bool, write summary clusters
+        self.blocked = set()            # set of Node, kept by focus() with
+                                        # requirements cut that aren't done
+
+        sources = self.load_includes(root, directory, cache, workers)
+
+        # definitions from every file, then the dependencies between them
+        for prefix, source in sources:
+            for line in source.definitions:
+                self.log('definition: ' + prefix + line)
+                try:
+                    node = self.new_node(prefix + line)
+                    self.nodes += [node]
+                    self.labels[node.label] = node
 
-        mode = 'definition'             # default parsing state
-
-        for line in contents:
-            # state machine, determine state and then take appropriate action
-            if line == 'options':
-                mode = line
-                continue
-
-            elif line == 'dependencies':
-                mode = line
-                continue
+                except bdgraph.BdgraphSyntaxError:
+                    raise bdgraph.BdgraphRuntimeError(
+                        'error: unrecongized syntax: ' + line)
 
-            # actions, we know our state so do something with the line
-            if mode == 'definition':
-                self.log('definition: ' + line)
+        for prefix, source in sources:
+            for line, requiring, providing in source.dependencies:
+                self.log('dependencies: ' + line)
                 try:
-                    self.nodes += [bdgraph.Node(line, logging=self.logging)]
+                    self.link([prefix + _ for _ in requiring],
+                              [prefix + _ for _ in providing])
 
                 except bdgraph.BdgraphNodeNotFound:
                     raise bdgraph.BdgraphRuntimeError(
-                        'error: unrecongized syntax: ' + line)
+                        'error: unrecongized node reference: ' + line)
 
-            elif mode == 'options':
-                self.log('options: ' + line)
-                for option in line.split(' '):
-                    try:
-                        self.graph_options += [bdgraph.GraphOption(option)]
+        # only the options of the top level file apply
+        for option in root.options:
+            self.log('options: ' + option)
+            try:
+                self.graph_options += [bdgraph.GraphOption(option)]
 
-                    except bdgraph.BdgraphSyntaxError:
-                        raise bdgraph.BdgraphRuntimeError(
-                            'error: unrecongized option: ' + option)
+            except bdgraph.BdgraphSyntaxError:
+                raise bdgraph.BdgraphRuntimeError(
+                    'error: unrecongized option: ' + option)
 
-            elif mode == 'dependencies':
-                self.log('dependencies: ' + line)
-                try:
-                    self.update_dependencies(line)
+        self.option_strings = [_.label for _ in self.graph_options]
+        self.options = self.option_strings
 
-                except bdgraph.BdgraphSyntaxError:
-                    raise bdgraph.BdgraphRuntimeError(
-                        'error: unrecongized dependency type: ' + line)
+    @classmethod
+    def from_file(cls, file_name, logging=False, cache=None, workers=None):
+        ''' string, bool, SourceCache, int -> Graph | BdgraphRuntimeError
 
-                except bdgraph.BdgraphNodeNotFound:
+        @file_name  input file to read, included files are relative to it
+
+        construct a Graph from a file on disk '''
+
+        with open(file_name, 'r') as fd:
+            contents = fd.read()
+
+        return cls(contents, logging=logging,
+                   directory=os.path.dirname(os.path.abspath(file_name)),
+                   cache=cache, workers=workers)
+
+    @classmethod
+    def from_nodes_edges(cls, nodes, edges, options=(), logging=False):
+        ''' dict of string: string | list of (string, string),
+            list of (string, string), list of string, bool
+            -> Graph | BdgraphRuntimeError
+
+        @nodes      labels and their descriptions, flags and weights included
+        @edges      (providing label, requiring label) pairs
+        @options    graph options, as in the options section
+
+        construct a Graph directly from data already in memory, without
+        formatting or parsing any text '''
+
+        graph = cls('', logging=logging)
+
+        if hasattr(nodes, 'items'):
+            nodes = nodes.items()
+
+        for label, description in nodes:
+            label = str(label)
+            try:
+                node = graph.new_node(label, str(description))
+
+            except (bdgraph.BdgraphSyntaxError, IndexError):
+                raise bdgraph.BdgraphRuntimeError(
+                    'error: unrecongized syntax: %s: %s'
+                    % (label, description))
+
+            if label in graph.labels:
+                raise bdgraph.BdgraphRuntimeError(
+                    'error: duplicate node label: ' + label)
+
+            graph.nodes.append(node)
+            graph.labels[label] = node
+
+        # Node.add_require() searches a list, a set of pairs is quicker here
+        linked = set()
+
+        for providing_label, requiring_label in edges:
+            try:
+                provider = graph.labels[str(providing_label)]
+                requirer = graph.labels[str(requiring_label)]
+
+            except KeyError:
+                raise bdgraph.BdgraphRuntimeError(
+                    'error: unrecongized node reference: %s -> %s'
+                    % (providing_label, requiring_label))
+
+            if (provider, requirer) not in linked:
+                linked.add((provider, requirer))
+                provider.provides.append(requirer)
+                requirer.requires.append(provider)
+
+        for option in options:
+            try:
+                graph.graph_options += [bdgraph.GraphOption(option)]
+
+            except bdgraph.BdgraphSyntaxError:
+                raise bdgraph.BdgraphRuntimeError(
+                    'error: unrecongized option: ' + option)
+
+        graph.option_strings += [_.label for _ in graph.graph_options]
+        return graph
+
+    @classmethod
+    def from_adjacency(cls, adjacency, descriptions=None, options=(),
+                       logging=False):
+        ''' dict of string: list of string, dict of string: string,
+            list of string, bool -> Graph | BdgraphRuntimeError
+
+        @adjacency      each label mapped to the labels it provides to
+        @descriptions   optional label to description mapping, labels are
+                        used as their own descriptions otherwise
+
+        construct a Graph from an adjacency mapping, see from_nodes_edges '''
+
+        descriptions = descriptions or {}
+        labels = {}
+
+        for label, children in adjacency.items():
+            labels[label] = None
+            for child in children:
+                labels[child] = None
+
+        nodes = [(label, descriptions.get(label, label)) for label in labels]
+        edges = [(label, child)
+                 for label, children in adjacency.items()
+                 for child in children]
+
+        return cls.from_nodes_edges(nodes, edges, options, logging)
+
+    def load_includes(self, root, directory, cache, workers):
+        ''' Source, string, SourceCache, int -> list of (string, Source)
+                                                | BdgraphRuntimeError
+
+        finds every file included by root, directly or not, and parses them.
+        each level of includes is read and parsed by a pool of threads. the
+        result pairs each file with the prefix for its labels, in the order
+        their nodes are numbered '''
+
+        if not root.includes:
+            return [('', root)]
+
+        def resolve(path, name):
+            return os.path.realpath(os.path.join(os.path.dirname(path), name))
+
+        def read(path):
+            try:
+                with open(path, 'r') as fd:
+                    return cache.parse(fd.read())
+
+            except IOError:
+                raise bdgraph.BdgraphRuntimeError(
+                    'error: unable to read include: ' + path)
+
+        # the root isn't a file, so stand in a path inside its directory
+        root_path = os.path.join(os.path.realpath(directory), '')
+        parsed = {root_path: root}
+
+        with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+            level = [root_path]
+
+            while level:
+                wanted = []
+                for path in level:
+                    for name, _ in parsed[path].includes:
+                        included = resolve(path, name)
+                        if included not in parsed and included not in wanted:
+                            wanted.append(included)
+
+                for path, source in zip(wanted, pool.map(read, wanted)):
+                    parsed[path] = source
+
+                level = wanted
+
+        # walk the includes again to namespace them, checking for cycles
+        result = []
+        todo = [('', root_path, ())]
+
+        while todo:
+            prefix, path, chain = todo.pop()
+            source = parsed[path]
+            result.append((prefix, source))
+
+            for name, namespace in reversed(source.includes):
+                included = resolve(path, name)
+
+                if included in chain:
                     raise bdgraph.BdgraphRuntimeError(
-                        'error: unrecongized node reference: ' + line)
+                        'error: include cycle: ' + name)
 
-        self.options = [_.label for _ in self.graph_options]
+                todo.append((prefix + namespace + '.', included,
+                             chain + (path,)))
 
-    def __del__(self):
-        ''' '''
-        bdgraph.node.Node.node_counter = 1
+        self.included = [path for path in parsed if path != root_path]
+        return result
 
     def show(self):
         ''' none -> IO
@@ -105,14 +283,22 @@ class Graph(object):
             node.show()
 
     def write_dot(self, file_name):
-        ''' string -> IO
+        ''' string -> bool, IO
 
         @file_name  name of the output graphviz file to write
 
-        writes the graph to a file in graphviz dot format. nodes write
-        themselves and handle their own options '''
+        writes the graph to a file in graphviz dot format. the file is only
+        replaced if its contents changed, returns whether it was '''
+
+        return bdgraph.Renderer.write_if_changed(file_name, self.format_dot())
+
+    def format_dot(self):
+        ''' none -> string
 
-        with open(file_name, 'w') as fd:
+        the graph in graphviz dot format. nodes write themselves and handle
+        their own options '''
+
+        with io.StringIO() as fd:
             # header
             fd.write('digraph g{\n'
                      '  rankdir=LR;\n'
@@ -123,23 +309,110 @@ class Graph(object):
             if bdgraph.Option.Circular in self.option_strings:
                 fd.write('  layout=neato;\n')
 
+            if bdgraph.Option.Critical in self.option_strings:
+                self.mark_critical_path()
+
             # graph contents
             for node in self.nodes:
                 node.write_dot(fd, self.graph_options)
 
+            # what each summary node stands for
+            if self.clusters:
+                for node in self.nodes:
+                    if node.members:
+                        self.write_cluster(fd, node, '  ')
+
             # footer
             fd.write('}\n')
 
+            return fd.getvalue()
+
+    def write_cluster(self, fd, cluster, indent):
+        ''' file descriptor, Node, string -> IO
+
+        writes the members of a summary node, and the relationships between
+        them, as a graphviz cluster. clusters inside it are written inside it
+        too '''
+
+        publish = bdgraph.Option.Publish in self.option_strings
+
+        def name(node):
+            if publish:
+                return '"%s"' % node.pretty_desc
+            return '"%s (%s)"' % (node.pretty_desc, node.number)
+
+        fd.write('%ssubgraph cluster_%s {\n' % (indent, cluster.number))
+        fd.write('%s  label="%s";\n' % (indent, cluster.description))
+        fd.write('%s  style=dashed;\n' % indent)
+
+        for member in cluster.members:
+            if member.members:
+                self.write_cluster(fd, member, indent + '  ')
+                continue
+
+            fd.write('%s  %s\n' % (indent, name(member)))
+
+            for child in member.provides:
+                if not child.members:
+                    fd.write('%s  %s -> %s\n' % (
+                        indent, name(member), name(child)))
+
+        fd.write('%s}\n' % indent)
+
+    def write_svg(self, file_name, sweeps=4):
+        ''' string, int -> bool, IO
+
+        @file_name  name of the output SVG file to write
+        @sweeps     rounds of crossing reduction, see bdgraph.Layout
+
+        draws the graph without graphviz, for graphs too big for it. the
+        file is only replaced if its contents changed, returns whether it
+        was '''
+
+        return bdgraph.Layout(self, sweeps).write_svg(file_name)
+
+    def write_jsonl(self, file_name):
+        ''' string -> bool, IO
+
+        @file_name  name of the output JSON Lines file to write
+
+        writes every node and relationship as a JSON record, with options
+        and cycles, for other programs to read. see bdgraph.Exporter. the
+        file is only replaced if its contents changed, returns whether it
+        was '''
+
+        return bdgraph.Exporter(self).write_jsonl(file_name)
+
+    def write_tsv(self, file_name):
+        ''' string -> bool, IO
+
+        @file_name  name of the output TSV file to write
+
+        writes every relationship as a row of a tab separated edge list. see
+        bdgraph.Exporter. the file is only replaced if its contents changed,
+        returns whether it was '''
+
+        return bdgraph.Exporter(self).write_tsv(file_name)
+
     def write_config(self, file_name):
-        ''' string -> IO
+        ''' string -> bool, IO
 
         @file_name  name of the output bdgraph to write
 
         rewrites the input file. this reformats definitions, options, and
         dependencies. it's also run after the Graph.compress_representation()
-        function so the dependency description is minimal '''
+        function so the dependency description is minimal. like write_dot, the
+        file is only replaced if its contents changed '''
+
+        return bdgraph.Renderer.write_if_changed(file_name,
+                                                 self.format_config())
+
+    def format_config(self):
+        ''' none -> string
 
-        with open(file_name, 'w') as fd:
+        the graph in the input file format, see Graph.write_config() '''
+
+        with io.StringIO() as fd:
             # header
             fd.write('#!/usr/local/bin/bdgraph\n')
             fd.write('# 1 <- 2,3 => 1 requires 2 and 3 \n')
@@ -161,6 +434,8 @@ class Graph(object):
             for node in self.nodes:
                 node.write_dependencies(fd)
 
+            return fd.getvalue()
+
     def update_dependencies(self, line):
         ''' string -> none | BdgraphSyntaxError, BdgraphNodeNotFound
 
@@ -172,43 +447,41 @@ class Graph(object):
             1,2,3 <- 4,5,6
 
         unrecongized dependency type throws a SyntaxError
-        unrecongized node references through AttributeError '''
+        unrecongized node references throw a NodeNotFound '''
 
-        left, right = 0, 1
+        requiring, providing = bdgraph.Source.parse_dependency(line)
+        self.link(requiring, providing)
 
-        # determine dependency type
-        require = line.split('<-')
-        allow = line.split('->')
-
-        # 1,2,3 <- 4,5,6
-        if len(require) > 1:
-            requiring_nodes = require[left].split(',')
-            providing_nodes = require[right].split(',')
-
-        # 1,2,3 -> 4,5,6
-        elif len(allow) > 1:
-            providing_nodes = allow[left].split(',')
-            requiring_nodes = allow[right].split(',')
-
-        # unrecongized dependency type
-        else:
-            raise bdgraph.BdgraphSyntaxError
+    def link(self, requiring_labels, providing_labels):
+        ''' list of string, list of string -> none | BdgraphNodeNotFound
 
-        # clean up labels
-        providing_nodes = [_.strip() for _ in providing_nodes]
-        requiring_nodes = [_.strip() for _ in requiring_nodes]
+        every requiring node requires every providing node '''
 
         # for each node
-        for requiring_label in requiring_nodes:
+        for requiring_label in requiring_labels:
             requiring_node = self.find_node(requiring_label)
 
-            for providing_label in providing_nodes:
+            for providing_label in providing_labels:
                 providing_node = self.find_node(providing_label)
 
                 # update requirements and provisions
                 requiring_node.add_require(providing_node)
                 providing_node.add_provide(requiring_node)
 
+    def new_node(self, line, description=None):
+        ''' string, string -> Node | BdgraphSyntaxError
+
+        @line           node definition, in the same format as the input file
+        @description    if provided, line is just the label
+
+        creates a node numbered after the ones before it. numbering is kept
+        per graph, so graphs can be built at the same time '''
+
+        node = bdgraph.Node(line, logging=self.logging,
+                            number=self.node_counter, description=description)
+        self.node_counter += 1
+        return node
+
     def find_node(self, label):
         ''' string -> Node | BdgraphNodeNotFound
 
@@ -217,15 +490,13 @@ class Graph(object):
         search through the graph's nodes for the node with the same label as
         the one provided. searches by label, not description '''
 
-        result = [node for node in self.nodes if node.label == label]
-
-        if not result:
+        if label not in self.labels:
             self.log('failed to find: ' + label)
             raise bdgraph.BdgraphNodeNotFound
 
         else:
             self.log('found: ' + label)
-            return result.pop()
+            return self.labels[label]
 
     def find_most(self, provide=False, require=False):
         ''' ('provide' | 'require') -> Node
@@ -245,8 +516,11 @@ class Graph(object):
 
         return highest
 
-    def compress_representation(self):
-        ''' none -> none
+    def compress_representation(self, budget=None):
+        ''' Budget -> none
+
+        @budget     limits on time and work, and a way to cancel. no limit if
+                    None
 
         analyzes relationships between nodes to find an equivalent graph of
         minimum size (# edges)
@@ -273,63 +547,109 @@ class Graph(object):
             4 -> 5      4 -> 5
 
         this process continues until the copied graph is empty of relationships
-        '''
 
-        # copy the graph so we can remove the most representative nodes as
-        # they're found. this way they won't be found on the next iteration
-        graph_copy = copy.deepcopy(self)
+        the copy is kept as lists of positions in self.nodes, and the most
+        representative nodes are found with a heap per direction rather than
+        a search, so this runs in O(E log V). ties go to the earliest node,
+        and the copy drops every other relationship of the node found on
+        each step, exactly as the original search over a deep copy did. see
+        bdgraph.Reference, which bdgraph.fuzz checks this against
 
-        while True:
-            most_provide = graph_copy.find_most(provide=True)
-            most_require = graph_copy.find_most(require=True)
+        if the budget runs out, relationships that haven't been found yet are
+        kept on the providing node only. the result is still correct, just
+        not as small, and Graph.truncated is set '''
+
+        if self.compressed:
+            self.expand_representation()
+
+        self.compressed = True
 
-            num_provides = len(most_provide.provides)
-            num_requires = len(most_require.requires)
+        position = {node: i for i, node in enumerate(self.nodes)}
+        real = {
+            'provides': [[position[_] for _ in node.provides]
+                         for node in self.nodes],
+            'requires': [[position[_] for _ in node.requires]
+                         for node in self.nodes],
+        }
+        copied = {direction: [list(_) for _ in lists]
+                  for direction, lists in real.items()}
+
+        # entries are (-count, position), stale ones are dropped when found
+        most = {direction: [(-len(_), i) for i, _ in enumerate(lists) if _]
+                for direction, lists in copied.items()}
+
+        for heap in most.values():
+            heapq.heapify(heap)
+
+        def find_most(direction):
+            heap, lists = most[direction], copied[direction]
+
+            while heap and -heap[0][0] != len(lists[heap[0][1]]):
+                heapq.heappop(heap)
+
+            return (-heap[0][0], heap[0][1]) if heap else (0, None)
+
+        def update(direction, i):
+            if copied[direction][i]:
+                heapq.heappush(most[direction],
+                               (-len(copied[direction][i]), i))
+
+        # (node, other) pairs to drop from node.provides or node.requires
+        removed = {'provides': set(), 'requires': set()}
+        cut_short = False
+
+        while True:
+            num_provides, most_provide = find_most('provides')
+            num_requires, most_require = find_most('requires')
 
             # there are no more relationships in the copied graph, stop
             if num_provides == num_requires == 0:
                 break
 
-            # the most representative relationship is a provision
-            elif num_provides > num_requires:
-
-                copy_node = most_provide
-                real_node = self.find_node(copy_node.label)
-
-                # inverse of provide is require
-                for inverse in copy_node.provides:
-                    try:
-                        inverse.requires.remove(copy_node)
-                        copy_node.provides.remove(inverse)
-                    except ValueError:
-                        pass
+            elif budget and not budget.spend(max(num_provides, num_requires)):
+                cut_short = True
+                break
 
-                # remove inverses from real graph
-                for inverse in real_node.provides:
-                    try:
-                        inverse.requires.remove(real_node)
-                    except ValueError:
-                        pass
+            # the most representative relationship is a provision, whose
+            # inverse is a requirement
+            elif num_provides > num_requires:
+                found = most_provide
+                direction, inverse = 'provides', 'requires'
 
             # the most representative relationship is a requirement
             else:
-                copy_node = most_require
-                real_node = self.find_node(copy_node.label)
-
-                # remove inverses and node from copied graph
-                for inverse in copy_node.requires:
-                    try:
-                        inverse.provides.remove(copy_node)
-                        copy_node.requires.remove(inverse)
-                    except ValueError:
-                        pass
-
-                # remove inverses from real graph
-                for inverse in real_node.requires:
-                    try:
-                        inverse.provides.remove(real_node)
-                    except ValueError:
-                        pass
+                found = most_require
+                direction, inverse = 'requires', 'provides'
+
+            # remove inverses and the node's relationships from the copy
+            others = copied[direction][found]
+            copied[direction][found] = others[1::2]
+            update(direction, found)
+
+            for other in others[0::2]:
+                copied[inverse][other].remove(found)
+                update(inverse, other)
+
+            # remove inverses from real graph
+            for other in real[direction][found]:
+                if (found, other) not in removed[direction]:
+                    removed[inverse].add((other, found))
+
+        # relationships still in both lists, only keep the provision
+        if cut_short:
+            self.truncated = True
+
+            for i, others in enumerate(real['provides']):
+                for other in others:
+                    if ((i, other) not in removed['provides'] and
+                            (other, i) not in removed['requires']):
+                        removed['requires'].add((other, i))
+
+        for i, node in enumerate(self.nodes):
+            node.provides = [_ for _ in node.provides
+                             if (i, position[_]) not in removed['provides']]
+            node.requires = [_ for _ in node.requires
+                             if (i, position[_]) not in removed['requires']]
 
     def handle_options(self):
         ''' none -> none
@@ -337,6 +657,7 @@ class Graph(object):
         handles non-user specified options, such as color_next and cleanup. '''
 
         if bdgraph.Option.Remove in self.option_strings:
+            self.reachability = None
             to_remove = []
 
             # find all nodes to be deleted
@@ -347,23 +668,27 @@ class Graph(object):
                 except AttributeError:
                     pass
 
-            # remove all marked nodes from the tree and other nodes
-            for node_to_remove in to_remove:
-                self.nodes.remove(node_to_remove)
+            # remove all marked nodes from the tree and other nodes, in one
+            # pass over the graph
+            removed = set(to_remove)
 
-                for node in self.nodes:
-                    if node_to_remove in node.requires:
-                        node.requires.remove(node_to_remove)
+            for node in to_remove:
+                self.forget_label(node)
+
+            self.nodes = [_ for _ in self.nodes if _ not in removed]
 
-                    if node_to_remove in node.provides:
-                        node.provides.remove(node_to_remove)
+            for node in self.nodes:
+                node.requires = [_ for _ in node.requires if _ not in removed]
+                node.provides = [_ for _ in node.provides if _ not in removed]
+
+            self.prune_dropped()
 
         if bdgraph.Option.Next in self.option_strings:
             for node in self.nodes:
 
                 # all requiring nodes have the complete flag? this is also true
                 # when the current node doesn't have any requiring nodes
-                requirements_satisfied = True
+                requirements_satisfied = node not in self.blocked
 
                 for req_node in node.requires:
                     if not req_node.node_option:
@@ -375,8 +700,11 @@ class Graph(object):
                 if (not node.node_option) and requirements_satisfied:
                     node.node_option = bdgraph.NodeOption('_')
 
-    def transitive_reduction(self):
-        ''' none -> none
+    def transitive_reduction(self, budget=None):
+        ''' Budget -> none
+
+        @budget     limits on time and work, and a way to cancel. no limit if
+                    None
 
         for all non-immediate children of each node, if that child has a
         relationship with the current node, remove it. this removes redundant
@@ -385,28 +713,675 @@ class Graph(object):
             1 -> 2,3     becomes    1 -> 2,3
             1 -> 3
 
-        cycles are currently not supported and are detected by
-        sys.getrecursionlimit() exceeding the number of nodes in the graph '''
+        cycles are not supported. they're detected up front, in which case
+        Graph.has_cycle is set and the graph is left as is. the search is
+        iterative and only touches this graph, so graphs in different threads
+        may be reduced at the same time
+
+        nodes are reduced one at a time, and each one leaves the graph valid.
+        if the budget runs out, the nodes left are skipped and
+        Graph.truncated is set
+
+        removed relationships are kept in Graph.dropped, so the editing
+        functions below can put them back if they stop being implied '''
+
+        # the index is rebuilt from the reduced graph on the next query
+        self.reachability = None
 
         if bdgraph.Option.NoReduce in self.option_strings:
             return
 
-        # limit recursion depth to catch cycles in the graph, 10 is a buffer
-        old_limit = sys.getrecursionlimit()
-        current_level = len(inspect.getouterframes(inspect.currentframe()))
-        sys.setrecursionlimit(len(self.nodes) + current_level + 20)
+        # the search only follows Node.provides
+        if self.compressed:
+            self.expand_representation()
 
         try:
-            # apply the transitive_reduction algorithm to every node
-            for node in self.nodes:
-                for child in node.provides:
-                    child.transitive_reduction(node, skip=True)
+            self.topological_order()
+
+        except bdgraph.BdgraphGraphLoopDetected:
+            self.has_cycle = True
+            return
+
+        for node in self.nodes:
+            if budget and not budget.spend():
+                break
+
+            # everything reachable through a child, but not the child itself
+            indirect = set()
+            todo = [grandchild
+                    for child in node.provides
+                    for grandchild in child.provides]
+
+            while todo:
+                current = todo.pop()
+                if current not in indirect:
+                    indirect.add(current)
+                    todo.extend(current.provides)
+
+                    # one search can be long, check in as it goes. what was
+                    # found so far is still reachable, so it's safe to use
+                    if (budget and len(indirect) % 1024 == 0 and
+                            not budget.spend(1024)):
+                        break
+
+            # the rest of the nodes the search visited
+            if budget:
+                budget.spend(len(indirect) % 1024)
+
+            for child in list(node.provides):
+                if child in indirect:
+                    self.drop(node, child)
+
+        if budget and budget.exhausted:
+            self.truncated = True
+        else:
+            self.reduced = True
+
+    def edges(self):
+        ''' none -> list of (Node, Node)
+
+        every provider -> requirer relationship in the graph, once each. this
+        looks at both Node.provides and Node.requires, so it's still correct
+        after Graph.compress_representation() '''
+
+        result = []
+        seen = set()
+
+        for node in self.nodes:
+            for child in node.provides:
+                if (id(node), id(child)) not in seen:
+                    seen.add((id(node), id(child)))
+                    result.append((node, child))
+
+            for parent in node.requires:
+                if (id(parent), id(node)) not in seen:
+                    seen.add((id(parent), id(node)))
+                    result.append((parent, node))
+
+        return result
+
+    def adjacency(self):
+        ''' none -> dict of Node: list of Node, dict of Node: list of Node
+
+        children and parents of every node in the graph, built from
+        Graph.edges() '''
+
+        children = {node: [] for node in self.nodes}
+        parents = {node: [] for node in self.nodes}
+
+        for parent, child in self.edges():
+            children[parent].append(child)
+            parents[child].append(parent)
+
+        return children, parents
+
+    def topological_order(self):
+        ''' none -> list of Node | BdgraphGraphLoopDetected
+
+        orders the nodes so that every node comes after all the nodes it
+        requires. this is Kahn's algorithm, ties are broken by the order of the
+        definitions. runs in O(V + E) '''
+
+        children, parents = self.adjacency()
+        remaining = {node: len(parents[node]) for node in self.nodes}
+
+        ready = collections.deque(
+            [node for node in self.nodes if remaining[node] == 0])
+        order = []
+
+        while ready:
+            node = ready.popleft()
+            order.append(node)
+
+            for child in children[node]:
+                remaining[child] -= 1
+                if remaining[child] == 0:
+                    ready.append(child)
+
+        # anything left over is part of, or depends on, a cycle
+        if len(order) != len(self.nodes):
+            raise bdgraph.BdgraphGraphLoopDetected
+
+        return order
+
+    def strongly_connected_components(self):
+        ''' none -> list of list of Node
+
+        groups the nodes into strongly connected components; every node in a
+        component can reach every other node in it. components are returned
+        in topological order, so a graph without cycles gives one component
+        per node. this is an iterative version of Tarjan's algorithm '''
+
+        children, _ = self.adjacency()
+
+        index = {}          # order each node was discovered in
+        lowlink = {}        # lowest index reachable from each node
+        stack = []          # nodes not yet assigned to a component
+        on_stack = set()
+        components = []
+
+        for root in self.nodes:
+            if root in index:
+                continue
+
+            # each frame is a node and an iterator over its children
+            work = [(root, iter(children[root]))]
+            index[root] = lowlink[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+
+            while work:
+                node, remaining = work[-1]
+                descended = False
+
+                for child in remaining:
+                    if child not in index:
+                        index[child] = lowlink[child] = len(index)
+                        stack.append(child)
+                        on_stack.add(child)
+                        work.append((child, iter(children[child])))
+                        descended = True
+                        break
+
+                    elif child in on_stack:
+                        lowlink[node] = min(lowlink[node], index[child])
+
+                if descended:
+                    continue
+
+                # all children are done, pop the frame
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+
+                # node is the root of a component
+                if lowlink[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member is node:
+                            break
+                    components.append(component)
+
+        components.reverse()
+        return components
+
+    def depths(self):
+        ''' none -> dict of Node: int | BdgraphGraphLoopDetected
+
+        the length of the longest chain of requirements above each node. nodes
+        that don't require anything have depth 0 '''
+
+        order = self.topological_order()
+        children, _ = self.adjacency()
+        depth = {node: 0 for node in order}
+
+        for node in order:
+            for child in children[node]:
+                depth[child] = max(depth[child], depth[node] + 1)
+
+        return depth
+
+    def heights(self):
+        ''' none -> dict of Node: int | BdgraphGraphLoopDetected
+
+        the length of the longest chain of nodes depending on each node. nodes
+        that don't provide anything have height 0 '''
+
+        order = self.topological_order()
+        children, _ = self.adjacency()
+        height = {node: 0 for node in order}
+
+        for node in reversed(order):
+            for child in children[node]:
+                height[node] = max(height[node], height[child] + 1)
+
+        return height
+
+    def critical_path(self, weights=None):
+        ''' dict of string: number -> list of Node, number
+                                     | BdgraphGraphLoopDetected
+
+        @weights    optional Node.label to weight mapping, overrides weights
+                    from the definitions
+
+        finds the heaviest chain of dependencies in the graph, and its total
+        weight. a node's weight comes from @weights, then from its definition
+        ('3: Chop up the log [4]'), and is otherwise 1 '''
+
+        weights = weights or {}
+        order = self.topological_order()
+        _, parents = self.adjacency()
+
+        def weight(node):
+            if node.label in weights:
+                return weights[node.label]
+            if node.weight is not None:
+                return node.weight
+            return 1
+
+        total = {}          # heaviest chain ending at each node
+        previous = {}       # the node before it on that chain
+
+        for node in order:
+            previous[node] = None
+            best = 0
+
+            for parent in parents[node]:
+                if previous[node] is None or total[parent] > best:
+                    previous[node] = parent
+                    best = total[parent]
+
+            total[node] = best + weight(node)
+
+        if not order:
+            return [], 0
+
+        # walk backwards from the end of the heaviest chain
+        node = max(order, key=lambda n: total[n])
+        length = total[node]
+        path = []
+
+        while node is not None:
+            path.append(node)
+            node = previous[node]
+
+        path.reverse()
+        return path, length
+
+    def mark_critical_path(self):
+        ''' none -> none
+
+        flags the nodes and edges along the critical path so Node.write_dot()
+        can highlight them. graphs with cycles don't have a critical path, so
+        nothing is marked '''
+
+        for node in self.nodes:
+            node.critical = False
+            node.critical_next = None
+
+        try:
+            path, _ = self.critical_path()
 
         except bdgraph.BdgraphGraphLoopDetected:
+            return
+
+        for node, next_node in zip(path, path[1:] + [None]):
+            node.critical = True
+            node.critical_next = next_node
+
+    def forget_label(self, node):
+        ''' Node -> none
+
+        drops node from the label lookup used by Graph.find_node() '''
+
+        if self.labels.get(node.label) is node:
+            del self.labels[node.label]
+
+    def expand_representation(self):
+        ''' none -> none
+
+        undoes Graph.compress_representation(), so every relationship is in
+        both Node.provides and Node.requires again. the editing functions
+        below need this, and call it themselves '''
+
+        for parent, child in self.edges():
+            parent.add_provide(child)
+            child.add_require(parent)
+
+        self.compressed = False
+
+    def add_node(self, line):
+        ''' string -> Node | BdgraphRuntimeError
+
+        @line   node definition, in the same format as the input file
+
+        adds a new node without any relationships '''
+
+        try:
+            node = self.new_node(line)
+
+        except bdgraph.BdgraphSyntaxError:
+            raise bdgraph.BdgraphRuntimeError(
+                'error: unrecongized syntax: ' + line)
+
+        if node.label in self.labels:
+            raise bdgraph.BdgraphRuntimeError(
+                'error: duplicate node label: ' + node.label)
+
+        self.nodes.append(node)
+        self.labels[node.label] = node
+        self.reachability = None
+        return node
+
+    def remove_node(self, label):
+        ''' string -> none | BdgraphNodeNotFound
+
+        removes the node and all its relationships. after
+        Graph.transitive_reduction(), relationships that reduction dropped
+        because they went through this node are put back, so the graph is
+        the same as reducing the input without the node. only the ancestors
+        and descendants of the node are visited '''
+
+        node = self.find_node(label)
+
+        if self.compressed:
+            self.expand_representation()
+
+        above = self.reachable(node, 'requires')
+        below = self.reachable(node, 'provides')
+
+        for parent in node.requires:
+            parent.provides.remove(node)
+
+        for child in node.provides:
+            child.requires.remove(node)
+
+        self.nodes.remove(node)
+        self.forget_label(node)
+        self.reachability = None
+
+        # dropped relationships to and from the node are gone with it
+        self.dropped.pop(node, None)
+        for parent in above:
+            self.dropped.get(parent, set()).discard(node)
+
+        above.discard(node)
+        below.discard(node)
+        self.restore(above, below)
+
+    def add_edge(self, providing_label, requiring_label):
+        ''' string, string -> none | BdgraphNodeNotFound
+
+        providing -> requiring
+
+        adds a relationship. after Graph.transitive_reduction() the graph is
+        kept reduced: nothing is added if the relationship is already implied,
+        and relationships the new one implies are removed. only the ancestors
+        of the providing node and the descendants of the requiring node are
+        visited. an edge that closes a cycle is added without removing
+        anything, since the cycle could be what implies the removed edges '''
+
+        provider = self.find_node(providing_label)
+        requirer = self.find_node(requiring_label)
+
+        if self.compressed:
+            self.expand_representation()
+
+        self.reachability = None
+
+        if not self.reduced:
+            requirer.add_require(provider)
+            provider.add_provide(requirer)
+            return
+
+        self.add_reduced(provider, requirer)
+
+    def add_reduced(self, provider, requirer):
+        ''' Node, Node -> none
+
+        see add_edge(). relationships that become redundant, including this
+        one if it's already implied, are kept in Graph.dropped '''
+
+        # already implied, or a duplicate
+        if requirer in self.reachable(provider, 'provides'):
+            if requirer not in provider.provides:
+                self.dropped.setdefault(provider, set()).add(requirer)
+            return
+
+        below = self.reachable(requirer, 'provides')
+
+        # closes a cycle, nothing can be safely removed
+        if provider in below:
             self.has_cycle = True
+            requirer.add_require(provider)
+            provider.add_provide(requirer)
+            return
+
+        above = self.reachable(provider, 'requires')
+
+        # every ancestor -> descendant edge is now implied by the new one
+        for parent in above:
+            for child in list(parent.provides):
+                if child in below:
+                    self.drop(parent, child)
+
+        requirer.add_require(provider)
+        provider.add_provide(requirer)
+
+    def remove_edge(self, providing_label, requiring_label):
+        ''' string, string -> none | BdgraphNodeNotFound
+
+        providing -> requiring
+
+        removes a relationship, if it exists. after
+        Graph.transitive_reduction(), relationships that reduction dropped
+        because of this one are put back, so the graph is the same as
+        reducing the input without it. only the ancestors of the providing
+        node and the descendants of the requiring node are visited '''
+
+        provider = self.find_node(providing_label)
+        requirer = self.find_node(requiring_label)
+
+        if self.compressed:
+            self.expand_representation()
+
+        # given, but dropped as redundant. nothing else depended on it
+        self.dropped.get(provider, set()).discard(requirer)
+
+        if requirer in provider.provides:
+            above = self.reachable(provider, 'requires')
+            below = self.reachable(requirer, 'provides')
+
+            provider.provides.remove(requirer)
+            requirer.requires.remove(provider)
+            self.reachability = None
+
+            self.restore(above, below)
+
+    def drop(self, provider, requirer):
+        ''' Node, Node -> none
+
+        removes a redundant relationship, remembering it in Graph.dropped '''
+
+        provider.provides.remove(requirer)
+        requirer.requires.remove(provider)
+        self.dropped.setdefault(provider, set()).add(requirer)
+
+    def prune_dropped(self):
+        ''' none -> none
+
+        forgets dropped relationships to or from nodes no longer in the
+        graph '''
+
+        if not self.dropped:
+            return
+
+        nodes = set(self.nodes)
+        self.dropped = {
+            node: set(_ for _ in children if _ in nodes)
+            for node, children in self.dropped.items() if node in nodes}
+
+    def restore(self, above, below):
+        ''' set of Node, set of Node -> none
+
+        after an edit removed relationships, puts back the dropped ones from
+        a node in above to a node in below that are no longer implied.
+        they're added the same way as add_edge(), so the graph stays
+        reduced '''
+
+        if not self.dropped:
+            return
+
+        for parent in above:
+            for child in list(self.dropped.get(parent, ())):
+                if child in below:
+                    self.dropped[parent].discard(child)
+                    self.add_reduced(parent, child)
+
+    def focus(self, label, depth=None, direction='down'):
+        ''' string, int, 'up' | 'down'
+            -> none | BdgraphNodeNotFound, BdgraphRuntimeError
+
+        @label      Node.label of the node to focus on
+        @depth      how many relationships away to look, no limit if None
+        @direction  'down' for the nodes requiring this one, 'up' for the
+                    nodes it requires
+
+        throws away everything but the neighborhood of one node. this is
+        meant to run right after parsing, so the rest of the pipeline only
+        works on the neighborhood. depth counts relationships as written in
+        the input, before Graph.transitive_reduction(). nodes that had
+        requirements cut off are remembered, so color_next colors the same
+        nodes it would in the whole graph '''
+
+        if direction not in ('up', 'down'):
+            raise bdgraph.BdgraphRuntimeError(
+                'error: unrecongized direction: ' + str(direction))
+
+        start = self.find_node(label)
+        follow = 'provides' if direction == 'down' else 'requires'
+
+        if self.compressed:
+            self.expand_representation()
+
+        # breadth first, one level at a time
+        keep = set([start])
+        level = [start]
+        distance = 0
+
+        while level and (depth is None or distance < depth):
+            following = []
+            for node in level:
+                for other in getattr(node, follow):
+                    if other not in keep:
+                        keep.add(other)
+                        following.append(other)
+
+            level = following
+            distance += 1
+
+        # color_next has to know about requirements outside the focus. the
+        # ones remove_marked would drop or that are complete don't count
+        done = [bdgraph.Option.Complete]
+        if bdgraph.Option.Remove in self.option_strings:
+            done.append(bdgraph.Option.Remove)
+
+        for node in keep:
+            for other in node.requires:
+                if other not in keep and not (
+                        other.node_option and other.node_option.type in done):
+                    self.blocked.add(node)
+
+            node.provides = [_ for _ in node.provides if _ in keep]
+            node.requires = [_ for _ in node.requires if _ in keep]
+
+        self.nodes = [node for node in self.nodes if node in keep]
+        self.labels = {node.label: node for node in self.nodes}
+        self.reachability = None
+        self.prune_dropped()
+
+    def summarize(self, budget, clusters=False):
+        ''' int, bool -> int
+
+        @budget     most nodes the graph should have
+        @clusters   write what each summary node stands for in write_dot
+
+        collapses cycles, chains and subtrees into summary nodes until the
+        graph fits the budget, see bdgraph.Summarizer. this is meant to run
+        after Graph.transitive_reduction(). returns the number of nodes left,
+        which is over budget if there was nothing left to collapse '''
+
+        self.clusters = clusters
+        remaining = bdgraph.Summarizer(self).summarize(budget)
+
+        # members of clusters aren't in the graph any more
+        self.prune_dropped()
+        return remaining
+
+    def diff(self, other):
+        ''' Graph -> Diff
+
+        @other  newer revision of this graph
+
+        the nodes and relationships added, removed and changed between this
+        graph and other, see bdgraph.Diff. nodes are matched by label, or by
+        their contents and neighbors, so the numbering doesn't matter '''
+
+        return bdgraph.Diff(self, other)
+
+    def structural_hashes(self):
+        ''' none -> dict of string: string
+
+        a hash for every node label, which changes only when the node, its
+        parents or its children change. useful as cache keys '''
+
+        return bdgraph.Diff.structural_hashes(self)
+
+    def reachable(self, node, direction):
+        ''' Node, 'provides' | 'requires' -> set of Node
+
+        every node reachable from node by following the given list, including
+        node itself '''
+
+        seen = set([node])
+        todo = [node]
+
+        while todo:
+            for other in getattr(todo.pop(), direction):
+                if other not in seen:
+                    seen.add(other)
+                    todo.append(other)
+
+        return seen
+
+    def build_reachability(self, max_bytes=None):
+        ''' int -> Reachability
+
+        @max_bytes  upper bound on the memory used by the index
+
+        builds the index used by Graph.depends_on(), Graph.ancestors() and
+        Graph.descendants(). this happens automatically on the first query,
+        but doing it explicitly after Graph.transitive_reduction() lets you
+        choose the memory bound. graphs too big for the bound are searched on
+        each query instead. see bdgraph.reachability for the costs '''
+
+        self.reachability = bdgraph.Reachability(self, max_bytes)
+        return self.reachability
+
+    def depends_on(self, requiring_label, providing_label):
+        ''' string, string -> bool | BdgraphNodeNotFound
+
+        does the first node transitively require the second? '''
+
+        if self.reachability is None:
+            self.build_reachability()
+
+        return self.reachability.depends_on(
+            self.find_node(requiring_label), self.find_node(providing_label))
+
+    def ancestors(self, label):
+        ''' string -> list of Node | BdgraphNodeNotFound
+
+        every node that the labeled node transitively requires '''
+
+        if self.reachability is None:
+            self.build_reachability()
+
+        return self.reachability.ancestors(self.find_node(label))
+
+    def descendants(self, label):
+        ''' string -> list of Node | BdgraphNodeNotFound
+
+        every node that transitively requires the labeled node '''
+
+        if self.reachability is None:
+            self.build_reachability()
 
-        finally:
-            sys.setrecursionlimit(old_limit)
+        return self.reachability.descendants(self.find_node(label))
 
     def log(self, comment):
         ''' string -> maybe IO
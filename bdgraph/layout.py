@@ -0,0 +1,284 @@
+#!/usr/bin/python3
+''' layout.py
+
+Description:
+    Draws a graph without graphviz, for graphs too big for it to lay out in
+    reasonable time. This is the usual layered drawing, done simply enough to
+    run in close to O(V + E) time:
+
+        layers      each node goes one layer to the right of its furthest
+                    parent, the longest path from the top of the graph
+        ordering    a few sweeps back and forth, sorting each layer by the
+                    average position of the nodes' parents, then children,
+                    which removes most crossings
+        placement   nodes sit level with the average of their parents where
+                    there's room, and are pushed down where there isn't
+
+    Relationships that skip layers are drawn as single curves, rather than
+    being routed around the nodes in between. The result is written straight
+    to SVG, with the same colors Graph.write_dot() gives graphviz
+'''
+
+import bdgraph
+import html
+import re
+
+
+class Layout(object):
+    ''' Class
+
+    Positions for every node of a Graph, and an SVG drawing of them. The
+    graph should already be reduced, since every relationship is drawn '''
+
+    char_width = 7          # pixels, estimated for 12px sans-serif
+    line_height = 14        # pixels
+    padding = 10            # pixels, around the text in a node
+    row_gap = 12            # pixels, between nodes in a layer
+    layer_gap = 60          # pixels, between layers
+    margin = 20             # pixels, around the drawing
+
+    def __init__(self, graph, sweeps=4):
+        ''' Graph, int -> Layout
+
+        @sweeps     rounds of crossing reduction, each one down and one up
+                    the layers '''
+
+        self.graph = graph
+        self.children, self.parents = graph.adjacency()
+
+        self.layers = []        # list of list of Node, left to right
+        self.layer = {}         # dict of Node: int
+        self.x = {}             # dict of Node: float, left edge
+        self.y = {}             # dict of Node: float, top edge
+        self.size = {}          # dict of Node: (int, int), pixels
+        self.width = 0          # pixels, of the whole drawing
+        self.height = 0         # pixels, of the whole drawing
+
+        for node in graph.nodes:
+            self.size[node] = self.measure(node)
+
+        self.assign_layers()
+        self.order(sweeps)
+        self.place()
+
+    def assign_layers(self):
+        ''' none -> none
+
+        longest path layering with Kahn's algorithm, O(V + E). nodes left
+        waiting on a cycle are released one at a time in definition order,
+        and relationships back into them are drawn pointing left '''
+
+        nodes = self.graph.nodes
+        remaining = {node: len(self.parents[node]) for node in nodes}
+        layer = self.layer
+
+        ready = [node for node in nodes if remaining[node] == 0]
+        stuck = 0
+
+        while len(layer) < len(nodes):
+            if not ready:
+                while nodes[stuck] in layer:
+                    stuck += 1
+                ready.append(nodes[stuck])
+
+            node = ready.pop()
+            layer[node] = 1 + max(
+                [layer[_] for _ in self.parents[node] if _ in layer] or [-1])
+
+            for child in self.children[node]:
+                remaining[child] -= 1
+                if remaining[child] == 0 and child not in layer:
+                    ready.append(child)
+
+        self.layers = [[] for _ in range(1 + max(layer.values() or [-1]))]
+        for node in nodes:
+            self.layers[layer[node]].append(node)
+
+    def order(self, sweeps):
+        ''' int -> none
+
+        barycenter crossing reduction. each sweep sorts every layer by the
+        average relative position of each node's neighbors, first parents
+        going right and then children going left. nodes without neighbors
+        that way keep their place. O(sweeps * (E + V log V)) '''
+
+        position = {}
+        for nodes in self.layers:
+            self.number(nodes, position)
+
+        for _ in range(sweeps):
+            for neighbors, layers in ((self.parents, self.layers[1:]),
+                                      (self.children, self.layers[-2::-1])):
+                for nodes in layers:
+                    nodes.sort(key=lambda node: Layout.barycenter(
+                        position, neighbors[node], position[node]))
+                    self.number(nodes, position)
+
+    def place(self):
+        ''' none -> none
+
+        x from the widest node of each layer, y from the parents of each
+        node, keeping the layer's order and at least row_gap between
+        nodes '''
+
+        x = Layout.margin
+        bottom = 0
+
+        for nodes in self.layers:
+            width = max(self.size[node][0] for node in nodes)
+            top = Layout.margin
+
+            for node in nodes:
+                node_width, node_height = self.size[node]
+                self.x[node] = x + (width - node_width) / 2
+
+                # level with the parents drawn so far, if there's room
+                parents = [self.y[_] for _ in self.parents[node]
+                           if _ in self.y]
+                wanted = sum(parents) / len(parents) if parents else top
+
+                self.y[node] = max(top, wanted)
+                top = self.y[node] + node_height + Layout.row_gap
+
+            x += width + Layout.layer_gap
+            bottom = max(bottom, top)
+
+        # an empty graph is just the margins
+        self.width = max(x - Layout.layer_gap + Layout.margin,
+                         2 * Layout.margin)
+        self.height = max(bottom - Layout.row_gap + Layout.margin,
+                          2 * Layout.margin)
+
+    def write_svg(self, file_name):
+        ''' string -> bool, IO
+
+        @file_name  name of the output SVG file to write
+
+        writes the drawing, streamed through a buffer rather than built in
+        memory. the file is only replaced if its contents changed, returns
+        whether it was '''
+
+        return bdgraph.Renderer.stream_if_changed(file_name, self.write)
+
+    def write(self, fd):
+        ''' file descriptor -> IO
+
+        see write_svg(). relationships come first, so nodes are drawn over
+        them '''
+
+        graph = self.graph
+        options = ' '.join(_.label for _ in graph.graph_options)
+
+        if bdgraph.Option.Critical in graph.option_strings:
+            graph.mark_critical_path()
+
+        fd.write(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<svg xmlns="http://www.w3.org/2000/svg" '
+            'width="%d" height="%d" viewBox="0 0 %d %d">\n'
+            '<defs><marker id="arrow" viewBox="0 0 10 10" refX="10" '
+            'refY="5" markerWidth="8" markerHeight="8" orient="auto">'
+            '<path d="M0,0 L10,5 L0,10 z"/></marker></defs>\n'
+            '<style>path.edge{fill:none;stroke:black;'
+            'marker-end:url(#arrow)} rect{stroke:black} '
+            'text{font:12px sans-serif;text-anchor:middle}</style>\n'
+            '<rect width="100%%" height="100%%" fill="white" '
+            'stroke="none"/>\n'
+            % (self.width, self.height, self.width, self.height))
+
+        for parent, child in graph.edges():
+            x1 = self.x[parent] + self.size[parent][0]
+            y1 = self.middle(parent)
+            x2, y2 = self.x[child], self.middle(child)
+            bend = (x2 - x1) / 2
+
+            fd.write('<path class="edge" d="M%.1f,%.1f C%.1f,%.1f %.1f,%.1f '
+                     '%.1f,%.1f"/>\n'
+                     % (x1, y1, x1 + bend, y1, x2 - bend, y2, x2, y2))
+
+        for node in graph.nodes:
+            width, height = self.size[node]
+            lines = self.lines(node)
+            top = self.y[node] + Layout.padding + Layout.line_height - 3
+
+            fd.write('<g><title>%s</title>'
+                     '<rect x="%.1f" y="%.1f" width="%d" height="%d" '
+                     'rx="%d" fill="%s"/>' % (
+                         html.escape(node.label), self.x[node], self.y[node],
+                         width, height, height / 2, self.color(node, options)))
+
+            for i, line in enumerate(lines):
+                fd.write('<text x="%.1f" y="%.1f">%s</text>' % (
+                    self.x[node] + width / 2, top + i * Layout.line_height,
+                    html.escape(line)))
+
+            fd.write('</g>\n')
+
+        fd.write('</svg>\n')
+
+    def lines(self, node):
+        ''' Node -> list of string
+
+        what the node says, the same as in Graph.write_dot(), split where
+        graphviz would break the line '''
+
+        text = node.pretty_desc
+        if bdgraph.Option.Publish not in self.graph.option_strings:
+            text += ' (%s)' % node.number
+
+        return [line.strip() for line in text.split('\\n')]
+
+    def measure(self, node):
+        ''' Node -> int, int
+
+        estimated width and height of the node in pixels '''
+
+        lines = self.lines(node)
+        return (max(len(_) for _ in lines) * Layout.char_width +
+                2 * Layout.padding,
+                len(lines) * Layout.line_height + 2 * Layout.padding)
+
+    def middle(self, node):
+        ''' Node -> float
+
+        y of the middle of the node '''
+
+        return self.y[node] + self.size[node][1] / 2
+
+    @staticmethod
+    def color(node, options):
+        ''' Node, string -> string
+
+        fill color, by the same rules as Node.write_dot(). graphviz fills
+        nodes without a color light grey '''
+
+        if node.node_option and node.node_option.type in options:
+            found = re.search('color="([^"]*)"', node.node_option.color)
+            if found:
+                return found.group(1)
+
+        elif node.critical:
+            return 'orange'
+
+        return 'lightgrey'
+
+    @staticmethod
+    def number(nodes, position):
+        ''' list of Node, dict of Node: float -> none
+
+        records each node's place in its layer, from 0 to 1, so layers of
+        different sizes can be compared '''
+
+        for i, node in enumerate(nodes):
+            position[node] = (i + 0.5) / len(nodes)
+
+    @staticmethod
+    def barycenter(position, neighbors, default):
+        ''' dict of Node: float, list of Node, float -> float
+
+        average position of the neighbors, or default if there are none '''
+
+        if not neighbors:
+            return default
+
+        return sum(position[_] for _ in neighbors) / len(neighbors)
@@ -13,6 +13,8 @@ Usage:
 '''
 
 import bdgraph
+import decimal
+import re
 
 
 class Node(object):
@@ -22,10 +24,14 @@ class Node(object):
     in particular the Node.provides and Node.requires attributes define the
     graph '''
 
-    node_counter = 1    # ensures Node.number is unique and contiguous
+    # optional trailing weight on a definition, '3: Chop up the log [4]'
+    weight_pattern = re.compile(r'\s*\[(\d+(?:\.\d+)?)\]$')
 
-    def __init__(self, label, logging=False):
-        ''' string -> Node | ValueError
+    def __init__(self, label, logging=False, number=1, description=None):
+        ''' string, bool, int, string -> Node | ValueError
+
+        the label may be a whole definition line, '3: Chop up the log', or
+        just the label when the description is given separately
 
         label       : number this Node is assigned in the input file
         description : description of the node from the input file
@@ -33,26 +39,44 @@ class Node(object):
         node_option : optional Node_Option
         provides    : list of nodes that this node is the parent to
         requires    : list of nodes that this node is a child to
-        number      : new number assigned to this Node '''
+        number      : new number assigned to this Node, Graph keeps these
+                      unique and contiguous
+        weight      : optional cost of the node, used by Graph.critical_path()
+        critical_next : next Node on the critical path, set by Graph
+        members     : nodes this one stands for, if it's a summary cluster '''
 
         self.log('node ' + label)
         self.label = ''             # string
         self.description = ''       # string
         self.pretty_desc = ''       # string
         self.node_option = None     # Node_Option
+        self.weight = None          # float
+        self.critical = False       # bool
+        self.critical_next = None   # Node
+        self.members = []           # list of Node
 
         self.provides = []          # list of Node
         self.requires = []          # list of Node
         self.logging = logging      # bool
 
-        self.number = str(Node.node_counter)
-        try:
-            self.label, self.description = \
-                [_.strip() for _ in label.split(':')]
+        self.number = str(number)
+        if description is not None:
+            self.label, self.description = label, description.strip()
+
+        else:
+            try:
+                self.label, self.description = \
+                    [_.strip() for _ in label.split(':')]
+
+            except ValueError:
+                raise bdgraph.BdgraphSyntaxError(
+                    'unable to unpack ' + label)
 
-        except ValueError:
-            raise bdgraph.BdgraphSyntaxError(
-                'unable to unpack ' + label)
+        # strip the weight, if there is one
+        match = Node.weight_pattern.search(self.description)
+        if match:
+            self.weight = float(match.group(1))
+            self.description = self.description[:match.start()]
 
         # break up description to multiple lines
         desc_len = len(self.description)
@@ -70,9 +94,6 @@ class Node(object):
         # check for options flags
         self.parse_options()
 
-        # update global node counter
-        Node.node_counter += 1
-
     def show(self):
         ''' none -> IO
 
@@ -140,22 +161,41 @@ class Node(object):
             right = '"%s (%s)"' % (node.pretty_desc, node.number)
 
             # write edges
-            fd.write('  %s -> %s\n' % (left, right))
+            fd.write('  %s -> %s%s\n' % (left, right, self.edge_style(node)))
 
         # write other -> self relationships
         for node in self.requires:
             right = '"%s (%s)"' % (node.pretty_desc, node.number)
 
             # write edges
-            fd.write('  %s -> %s\n' % (right, left))
+            fd.write('  %s -> %s%s\n' % (right, left, node.edge_style(self)))
 
         # apply options if they're enabled at the graph level
         if self.node_option and self.node_option.type in graph_option_labels:
             left += ' ' + self.node_option.color
 
+        # otherwise, highlight the critical path if it's been computed
+        elif self.critical:
+            left += ' [color="orange"]'
+
+        # summary clusters stand out from regular nodes
+        if self.members and not self.node_option:
+            left += ' [shape=box3d]'
+
         # write node by itself
         fd.write('  ' + left + '\n')
 
+    def edge_style(self, node):
+        ''' Node -> string
+
+        attributes for the self -> node edge in graphviz dot format. only edges
+        along the critical path are styled '''
+
+        if self.critical_next is node:
+            return ' [color="darkorange", penwidth=3]'
+
+        return ''
+
     def write_definition(self, fd):
         ''' file descriptor -> None
 
@@ -175,7 +215,24 @@ class Node(object):
         if self.node_option:
             fd.write(self.node_option.flag)
 
-        fd.write(self.description + '\n')
+        fd.write(self.description)
+
+        if self.weight is not None:
+            fd.write(' [%s]' % Node.format_weight(self.weight))
+
+        fd.write('\n')
+
+    @staticmethod
+    def format_weight(weight):
+        ''' float -> string
+
+        the weight in a form weight_pattern reads back exactly, never in
+        exponent notation: 3 for 3.0, 0.0000001 for 1e-07 '''
+
+        if weight == int(weight):
+            return '%d' % weight
+
+        return format(decimal.Decimal(repr(weight)), 'f')
 
     def write_dependencies(self, fd):
         ''' file descriptor -> None
@@ -210,27 +267,6 @@ class Node(object):
             self.description = self.description[1:]
             self.pretty_desc = self.pretty_desc[1:]
 
-    def transitive_reduction(self, node, skip=False):
-        ''' Node, bool -> none | BdgraphGraphLoopDetected
-
-        skip allows us to jump over immediate children, since we don't want to
-        affect their relationships. see Graph.transitive_reduction() for an
-        explaination of the algorithm '''
-
-        if not skip:
-            # remove relationships with non-immediate children
-            if self in node.provides:
-                node.provides.remove(self)
-                self.requires.remove(node)
-
-        # recurse
-        try:
-            for child in self.provides:
-                child.transitive_reduction(node)
-
-        except RuntimeError:
-            raise bdgraph.BdgraphGraphLoopDetected
-
     def log(self, comment):
         ''' string -> maybe IO
 
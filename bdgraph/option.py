@@ -11,9 +11,11 @@ class Option():
     Publish = 'publish'
     Remove = 'remove_marked'
     NoReduce = 'no_reduce'
+    Critical = 'color_critical'
 
     options = \
-        [Complete, Next, Urgent, Cleanup, Circular, Publish, Remove, NoReduce]
+        [Complete, Next, Urgent, Cleanup, Circular, Publish, Remove, NoReduce,
+         Critical]
 
     def __init__(self):
         pass
@@ -0,0 +1,401 @@
+#!/usr/bin/python3
+''' reachability.py
+
+Description:
+    Precomputed index answering "does X depend on Y" without walking the graph
+
+    Cycles are handled by indexing the strongly connected components of the
+    graph, which always form a DAG. That DAG is split into few chains, lists
+    of components where each one reaches the next, by a maximum matching
+    between components and their children. For every component the index
+    stores the earliest position in each chain it can reach, and the latest
+    position in each chain that can reach it. Since every later node in a
+    chain is reachable from an earlier one, a single comparison answers a
+    query.
+
+Memory:
+    With C components and k chains, chain labels take 2 * C * k machine
+    integers. Graphs that don't decompose into few chains (wide, shallow
+    graphs) use bitsets instead, which take 2 * C * C bits. Whichever is
+    smaller is used. If both are over max_bytes, 256 MiB by default, nothing
+    is precomputed and each query searches the component DAG instead, which
+    takes O(C + E) time but no extra memory.
+'''
+
+import array
+import heapq
+
+
+class Reachability(object):
+    ''' Class
+
+    Answers depends_on() in constant time, and ancestors() and descendants()
+    in time linear in the size of the result (plus the number of chains),
+    unless the graph is too big to index. The index describes the graph at
+    the time it was built; Graph throws it away whenever the graph
+    changes '''
+
+    max_bytes = 256 * 1024 * 1024
+    join_steps = 1024           # search limit when joining chains
+
+    def __init__(self, graph, max_bytes=None):
+        ''' Graph, int -> Reachability
+
+        builds the index for the graph provided '''
+
+        if max_bytes is None:
+            max_bytes = Reachability.max_bytes
+
+        self.components = graph.strongly_connected_components()
+        self.component = {}         # dict of Node: int
+        self.cyclic = set()         # set of int, components with a cycle
+        self.mode = None            # 'chains' | 'bitsets' | 'search'
+        self.down = None            # labels of what each component reaches
+        self.up = None              # labels of what reaches each component
+        self.last = None            # (source, down, limit), set of int
+
+        children, _ = graph.adjacency()
+
+        for number, members in enumerate(self.components):
+            for node in members:
+                self.component[node] = number
+
+        # edges between components, components are in topological order
+        self.children = [set() for _ in self.components]
+        self.parents = [set() for _ in self.components]
+
+        for parent, kids in children.items():
+            for child in kids:
+                source = self.component[parent]
+                target = self.component[child]
+
+                if source == target:
+                    self.cyclic.add(source)
+                else:
+                    self.children[source].add(target)
+                    self.parents[target].add(source)
+
+        self.decompose()
+
+        size = len(self.components)
+        chain_bytes = 2 * size * len(self.chains) * array.array('l').itemsize
+        bitset_bytes = 2 * size * size // 8
+
+        if min(chain_bytes, bitset_bytes) > max_bytes:
+            self.mode = 'search'
+        elif chain_bytes <= bitset_bytes:
+            self.build_chains()
+        else:
+            self.build_bitsets()
+
+    def decompose(self):
+        ''' none -> none
+
+        splits the component DAG into chains. first into as few paths as
+        possible: each component is matched with at most one child, which
+        follows it, see match(). then paths are joined end to start wherever
+        the end reaches a start, since a chain only needs each component to
+        reach the next, not to be its parent '''
+
+        size = len(self.components)
+        following = self.match()
+        heads = set(range(size)) - set(following.values())
+        tails = set(range(size)) - set(following)
+
+        # latest ends first, each to the nearest start it reaches. a start
+        # comes before its end, so this can't join a chain to itself
+        for tail in sorted(tails, reverse=True):
+            head = self.nearest(tail, heads)
+            if head is not None:
+                following[tail] = head
+                heads.discard(head)
+
+        chain = [None] * size
+        position = [None] * size
+        self.chains = []            # list of list of int
+
+        for start in sorted(heads):
+            path = []
+            current = start
+
+            while current is not None:
+                chain[current] = len(self.chains)
+                position[current] = len(path)
+                path.append(current)
+                current = following.get(current)
+
+            self.chains.append(path)
+
+        self.chain = chain          # component -> chain number
+        self.position = position    # component -> position in its chain
+
+    def nearest(self, source, targets):
+        ''' int, set of int -> int | None
+
+        the first of targets reachable from source, other than source, in
+        topological order. looks at no more than join_steps components '''
+
+        seen = set([source])
+        todo = [source]
+
+        for _ in range(Reachability.join_steps):
+            if not todo:
+                break
+
+            current = heapq.heappop(todo)
+            if current in targets and current != source:
+                return current
+
+            for child in self.children[current]:
+                if child not in seen:
+                    seen.add(child)
+                    heapq.heappush(todo, child)
+
+        return None
+
+    def match(self):
+        ''' none -> dict of int: int
+
+        maximum matching of components to children, with Hopcroft-Karp.
+        returns each matched component's child. O(E * sqrt(C)) '''
+
+        size = len(self.components)
+        child_of = [None] * size
+        parent_of = [None] * size
+
+        # a greedy start leaves little for the phases below
+        for v in range(size):
+            for u in self.children[v]:
+                if parent_of[u] is None:
+                    child_of[v], parent_of[u] = u, v
+                    break
+
+        while True:
+            # breadth first from unmatched parents, in alternating layers
+            free = [v for v in range(size) if child_of[v] is None]
+            distance = [None] * size
+            for v in free:
+                distance[v] = 0
+
+            queue = list(free)
+            found = False
+
+            for v in queue:
+                for u in self.children[v]:
+                    w = parent_of[u]
+                    if w is None:
+                        found = True
+                    elif distance[w] is None:
+                        distance[w] = distance[v] + 1
+                        queue.append(w)
+
+            if not found:
+                break
+
+            # depth first along the layers for disjoint augmenting paths
+            for root in free:
+                stack = [root]
+                through = []
+                options = [iter(self.children[root])]
+
+                while stack:
+                    v = stack[-1]
+                    step = None
+
+                    for u in options[-1]:
+                        w = parent_of[u]
+                        if w is None or distance[w] == distance[v] + 1:
+                            step = u, w
+                            break
+
+                    if step is None:
+                        # dead end, don't come back this phase
+                        distance[v] = None
+                        stack.pop()
+                        options.pop()
+                        if through:
+                            through.pop()
+                        continue
+
+                    u, w = step
+                    if w is not None:
+                        stack.append(w)
+                        through.append(u)
+                        options.append(iter(self.children[w]))
+                        continue
+
+                    # free child found, flip the path
+                    for left, right in zip(stack, through + [u]):
+                        child_of[left], parent_of[right] = right, left
+                        distance[left] = None
+                    break
+
+        return {v: u for v, u in enumerate(child_of) if u is not None}
+
+    def build_chains(self):
+        ''' none -> none
+
+        fills in the chain labels. self.down[v * k + c] is the first position
+        in chain c reachable from component v, and self.up[v * k + c] is the
+        last position in chain c that reaches v '''
+
+        self.mode = 'chains'
+        size = len(self.components)
+        width = len(self.chains)
+        never = size                # past the end of any chain
+
+        self.down = array.array('l', [never]) * (size * width)
+        self.up = array.array('l', [-1]) * (size * width)
+
+        # children come later in topological order
+        for v in reversed(range(size)):
+            row = v * width
+            for child in self.children[v]:
+                other = child * width
+                for c in range(width):
+                    if self.down[other + c] < self.down[row + c]:
+                        self.down[row + c] = self.down[other + c]
+
+            self.down[row + self.chain[v]] = self.position[v]
+
+        for v in range(size):
+            row = v * width
+            for parent in self.parents[v]:
+                other = parent * width
+                for c in range(width):
+                    if self.up[other + c] > self.up[row + c]:
+                        self.up[row + c] = self.up[other + c]
+
+            self.up[row + self.chain[v]] = self.position[v]
+
+    def build_bitsets(self):
+        ''' none -> none
+
+        fills in the bitsets. bit u of self.down[v] is set when component v
+        reaches component u, and the reverse for self.up '''
+
+        self.mode = 'bitsets'
+        size = len(self.components)
+
+        self.down = [0] * size
+        self.up = [0] * size
+
+        for v in reversed(range(size)):
+            bits = 1 << v
+            for child in self.children[v]:
+                bits |= self.down[child]
+            self.down[v] = bits
+
+        for v in range(size):
+            bits = 1 << v
+            for parent in self.parents[v]:
+                bits |= self.up[parent]
+            self.up[v] = bits
+
+    def reaches(self, source, target):
+        ''' int, int -> bool
+
+        can component source reach component target? every component reaches
+        itself '''
+
+        if self.mode == 'bitsets':
+            return bool(self.down[source] >> target & 1)
+
+        if self.mode == 'search':
+            return target in self.search(source, True, target)
+
+        width = len(self.chains)
+        first = self.down[source * width + self.chain[target]]
+        return first <= self.position[target]
+
+    def depends_on(self, requiring, providing):
+        ''' Node, Node -> bool
+
+        does requiring transitively require providing? a node only depends on
+        itself when it's part of a cycle '''
+
+        source = self.component[providing]
+        target = self.component[requiring]
+
+        if source == target:
+            return (requiring is not providing or
+                    len(self.components[source]) > 1 or
+                    source in self.cyclic)
+
+        return self.reaches(source, target)
+
+    def descendants(self, node):
+        ''' Node -> list of Node
+
+        every node that transitively requires this one '''
+
+        return self.collect(node, self.down, down=True)
+
+    def ancestors(self, node):
+        ''' Node -> list of Node
+
+        every node that this one transitively requires '''
+
+        return self.collect(node, self.up, down=False)
+
+    def collect(self, node, labels, down):
+        ''' Node, array | list, bool -> list of Node
+
+        expands the labels for node's component into the nodes they cover '''
+
+        own = self.component[node]
+        found = []
+
+        if self.mode == 'bitsets':
+            bits = labels[own]
+            while bits:
+                low = bits & -bits
+                found.append(low.bit_length() - 1)
+                bits ^= low
+
+        elif self.mode == 'search':
+            found = self.search(own, down)
+
+        else:
+            width = len(self.chains)
+            for c, chain in enumerate(self.chains):
+                mark = labels[own * width + c]
+                found.extend(chain[mark:] if down else chain[:mark + 1])
+
+        result = []
+        for number in found:
+            for member in self.components[number]:
+                if member is not node:
+                    result.append(member)
+
+        # the node itself is only included if it's on a cycle
+        if len(self.components[own]) > 1 or own in self.cyclic:
+            result.append(node)
+
+        return result
+
+    def search(self, source, down, limit=None):
+        ''' int, bool, int -> set of int
+
+        every component reachable from source, including itself, following
+        children if down and parents otherwise. components are in
+        topological order, so going down, nothing past limit can lead back to
+        it and those are skipped. the last search is remembered, since
+        queries often repeat their source '''
+
+        key = (source, down, limit)
+        if self.last and self.last[0] == key:
+            return self.last[1]
+
+        following = self.children if down else self.parents
+        seen = set([source])
+        todo = [source]
+
+        while todo:
+            for other in following[todo.pop()]:
+                if other not in seen and (limit is None or other <= limit):
+                    seen.add(other)
+                    todo.append(other)
+
+        self.last = key, seen
+        return seen
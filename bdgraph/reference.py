@@ -0,0 +1,208 @@
+#!/usr/bin/python3
+''' reference.py
+
+Description:
+    The original, straightforward versions of the graph operations that have
+    since been rewritten for speed. They're kept as an oracle: the fuzzer in
+    bdgraph.fuzz runs both versions on the same random graphs and checks that
+    the results agree. Don't optimize anything in here
+'''
+
+import bdgraph
+import copy
+
+
+class Reference(object):
+    ''' Class
+
+    Runs the reference operations on a Graph in place, the same way the
+    Graph methods of the same names do '''
+
+    def __init__(self, graph):
+        ''' Graph -> Reference '''
+
+        self.graph = graph
+
+    def handle_options(self):
+        ''' none -> none
+
+        handles non-user specified options, such as color_next and cleanup.
+        marked nodes are removed one at a time, searching every other node
+        for each, O(V * (V + E)) '''
+
+        graph = self.graph
+
+        if bdgraph.Option.Remove in graph.option_strings:
+            graph.reachability = None
+            to_remove = []
+
+            # find all nodes to be deleted
+            for node in graph.nodes:
+                try:
+                    if node.node_option.type == bdgraph.Option.Remove:
+                        to_remove.append(node)
+                except AttributeError:
+                    pass
+
+            # remove all marked nodes from the tree and other nodes
+            for node_to_remove in to_remove:
+                graph.nodes.remove(node_to_remove)
+                graph.forget_label(node_to_remove)
+
+                for node in graph.nodes:
+                    if node_to_remove in node.requires:
+                        node.requires.remove(node_to_remove)
+
+                    if node_to_remove in node.provides:
+                        node.provides.remove(node_to_remove)
+
+        if bdgraph.Option.Next in graph.option_strings:
+            for node in graph.nodes:
+
+                # all requiring nodes have the complete flag? this is also true
+                # when the current node doesn't have any requiring nodes
+                requirements_satisfied = True
+
+                for req_node in node.requires:
+                    if not req_node.node_option:
+                        requirements_satisfied = False
+
+                    elif req_node.node_option.type != bdgraph.Option.Complete:
+                        requirements_satisfied = False
+
+                if (not node.node_option) and requirements_satisfied:
+                    node.node_option = bdgraph.NodeOption('_')
+
+    def transitive_reduction(self):
+        ''' none -> none
+
+        for all non-immediate children of each node, if that child has a
+        relationship with the current node, remove it. every path is walked
+        separately, so this is exponential in the worst case
+
+        a cycle is detected when a walk comes back to a node already on it.
+        Graph.has_cycle is set and whatever was reduced before then stays
+        reduced '''
+
+        graph = self.graph
+        graph.reachability = None
+
+        if bdgraph.Option.NoReduce in graph.option_strings:
+            return
+
+        try:
+            for node in graph.nodes:
+                for child in list(node.provides):
+                    self.reduce(child, node, [node], skip=True)
+
+        except bdgraph.BdgraphGraphLoopDetected:
+            graph.has_cycle = True
+            return
+
+        graph.reduced = True
+
+    def reduce(self, current, node, path, skip=False):
+        ''' Node, Node, list of Node, bool -> none | BdgraphGraphLoopDetected
+
+        skip allows us to jump over immediate children, since we don't want to
+        affect their relationships '''
+
+        if current in path:
+            raise bdgraph.BdgraphGraphLoopDetected
+
+        if not skip:
+            # remove relationships with non-immediate children
+            if current in node.provides:
+                node.provides.remove(current)
+                current.requires.remove(node)
+
+        path.append(current)
+
+        for child in list(current.provides):
+            self.reduce(child, node, path)
+
+        path.pop()
+
+    def compress_representation(self):
+        ''' none -> none
+
+        see Graph.compress_representation(). this version searches a copy of
+        the graph for the most representative node on every step '''
+
+        graph = self.graph
+
+        # copy the graph so we can remove the most representative nodes as
+        # they're found. this way they won't be found on the next iteration
+        graph_copy = self.copy()
+        graph.compressed = True
+
+        while True:
+            most_provide = graph_copy.find_most(provide=True)
+            most_require = graph_copy.find_most(require=True)
+
+            num_provides = len(most_provide.provides)
+            num_requires = len(most_require.requires)
+
+            # there are no more relationships in the copied graph, stop
+            if num_provides == num_requires == 0:
+                break
+
+            # the most representative relationship is a provision
+            elif num_provides > num_requires:
+
+                copy_node = most_provide
+                real_node = graph.find_node(copy_node.label)
+
+                # inverse of provide is require
+                for inverse in copy_node.provides:
+                    try:
+                        inverse.requires.remove(copy_node)
+                        copy_node.provides.remove(inverse)
+                    except ValueError:
+                        pass
+
+                # remove inverses from real graph
+                for inverse in real_node.provides:
+                    try:
+                        inverse.requires.remove(real_node)
+                    except ValueError:
+                        pass
+
+            # the most representative relationship is a requirement
+            else:
+                copy_node = most_require
+                real_node = graph.find_node(copy_node.label)
+
+                # remove inverses and node from copied graph
+                for inverse in copy_node.requires:
+                    try:
+                        inverse.provides.remove(copy_node)
+                        copy_node.requires.remove(inverse)
+                    except ValueError:
+                        pass
+
+                # remove inverses from real graph
+                for inverse in real_node.requires:
+                    try:
+                        inverse.provides.remove(real_node)
+                    except ValueError:
+                        pass
+
+    def copy(self):
+        ''' none -> Graph
+
+        a copy of the graph with its own nodes. copy.deepcopy() would do, but
+        it recurses along every path in the graph and runs out of stack on
+        big ones '''
+
+        graph = self.graph
+        twins = {node: copy.copy(node) for node in graph.nodes}
+
+        for twin in twins.values():
+            twin.provides = [twins[_] for _ in twin.provides]
+            twin.requires = [twins[_] for _ in twin.requires]
+
+        graph_copy = copy.copy(graph)
+        graph_copy.nodes = [twins[_] for _ in graph.nodes]
+        graph_copy.labels = {_.label: _ for _ in graph_copy.nodes}
+        return graph_copy
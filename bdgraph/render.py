@@ -0,0 +1,193 @@
+#!/usr/bin/python3
+''' render.py
+
+Description:
+    Runs graphviz over written dot files to produce images, and writes files
+    only when their contents change so that anything watching them isn't
+    woken up for nothing
+'''
+
+import bdgraph
+import concurrent.futures
+import filecmp
+import hashlib
+import io
+import os
+import subprocess
+import tempfile
+
+
+class Renderer(object):
+    ''' Class
+
+    Renders dot files with the local graphviz binary. Each output format of
+    each file is one job, and jobs run in a bounded pool of subprocesses '''
+
+    buffer_size = 1 << 16           # bytes, for streamed output files
+
+    def __init__(self, formats=('svg',), workers=None, binary='dot',
+                 timeout=None):
+        ''' list of string, int, string, number -> Renderer
+
+        @formats    graphviz output formats, like 'svg' and 'png'
+        @workers    most graphviz processes to run at once
+        @binary     graphviz layout program to run
+        @timeout    seconds to allow each process, no limit if None '''
+
+        self.formats = list(formats)
+        self.workers = workers or os.cpu_count() or 1
+        self.binary = binary
+        self.timeout = timeout
+
+    def render(self, dot_files):
+        ''' list of string -> list of (string, bool) | BdgraphRuntimeError
+
+        renders every dot file in every format. returns each output file and
+        whether it changed '''
+
+        jobs = [(dot_file, output_format)
+                for dot_file in dot_files
+                for output_format in self.formats]
+
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as pool:
+            return list(pool.map(lambda job: self.render_one(*job), jobs))
+
+    def render_one(self, dot_file, output_format):
+        ''' string, string -> string, bool | BdgraphRuntimeError
+
+        renders one dot file in one format. graphviz isn't run at all if the
+        output is already newer than the dot file, and the output isn't
+        rewritten if graphviz produced the same thing as last time '''
+
+        output_file = Renderer.output_name(dot_file, output_format)
+
+        try:
+            if os.stat(output_file).st_mtime > os.stat(dot_file).st_mtime:
+                return output_file, False
+
+        except OSError:
+            pass
+
+        try:
+            process = subprocess.run(
+                [self.binary, '-T' + output_format, dot_file],
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                timeout=self.timeout)
+
+        except OSError:
+            raise bdgraph.BdgraphRuntimeError(
+                'error: unable to run graphviz: ' + self.binary)
+
+        except subprocess.TimeoutExpired:
+            raise bdgraph.BdgraphRuntimeError(
+                'error: graphviz timed out on: ' + dot_file)
+
+        if process.returncode != 0:
+            raise bdgraph.BdgraphRuntimeError(
+                'error: graphviz failed on %s: %s'
+                % (dot_file, process.stderr.decode('utf-8', 'replace')))
+
+        changed = Renderer.write_if_changed(output_file, process.stdout)
+
+        # bump the time anyway, so it's newer than the dot file next time
+        if not changed:
+            os.utime(output_file)
+
+        return output_file, changed
+
+    @staticmethod
+    def output_name(dot_file, output_format):
+        ''' string, string -> string
+
+        graph.bdot.dot becomes graph.bdot.svg '''
+
+        base, extension = os.path.splitext(dot_file)
+        if extension != '.dot':
+            base = dot_file
+
+        return base + '.' + output_format
+
+    @staticmethod
+    def write_if_changed(file_name, contents):
+        ''' string, string | bytes -> bool
+
+        atomically replaces file_name with contents, unless it already holds
+        exactly that. returns whether the file was written '''
+
+        if isinstance(contents, str):
+            contents = contents.encode('utf-8')
+
+        # replace what a link points to, not the link
+        file_name = os.path.realpath(file_name)
+
+        digest = hashlib.sha256(contents).digest()
+
+        try:
+            with open(file_name, 'rb') as fd:
+                if hashlib.sha256(fd.read()).digest() == digest:
+                    return False
+
+        except IOError:
+            pass
+
+        # write next to the destination, then swap it in
+        directory = os.path.dirname(file_name)
+        fd, temporary = tempfile.mkstemp(dir=directory, prefix='.bdgraph-')
+
+        try:
+            with os.fdopen(fd, 'wb') as temporary_fd:
+                temporary_fd.write(contents)
+
+            Renderer.swap(temporary, file_name)
+
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+        return True
+
+    @staticmethod
+    def stream_if_changed(file_name, write):
+        ''' string, function -> bool
+
+        like write_if_changed, but the contents are written by write(fd) to a
+        buffered text file, so they never have to fit in memory. the old and
+        new files are compared on disk '''
+
+        file_name = os.path.realpath(file_name)
+        directory = os.path.dirname(file_name)
+        fd, temporary = tempfile.mkstemp(dir=directory, prefix='.bdgraph-')
+
+        try:
+            with io.open(fd, 'w', encoding='utf-8',
+                         buffering=Renderer.buffer_size) as temporary_fd:
+                write(temporary_fd)
+
+            if (os.path.exists(file_name) and
+                    filecmp.cmp(temporary, file_name, shallow=False)):
+                os.unlink(temporary)
+                return False
+
+            Renderer.swap(temporary, file_name)
+
+        except BaseException:
+            if os.path.exists(temporary):
+                os.unlink(temporary)
+            raise
+
+        return True
+
+    @staticmethod
+    def swap(temporary, file_name):
+        ''' string, string -> none
+
+        moves temporary over file_name in one step, keeping file_name's
+        permissions if it exists '''
+
+        # mkstemp only allows the owner to read the file
+        if os.path.exists(file_name):
+            os.chmod(temporary, os.stat(file_name).st_mode & 0o777)
+        else:
+            os.chmod(temporary, 0o644)
+
+        os.replace(temporary, file_name)
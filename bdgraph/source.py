@@ -0,0 +1,170 @@
+#!/usr/bin/python3
+''' source.py
+
+Description:
+    Splits an input file into its sections without building any Nodes, so the
+    result can be cached and shared between graphs. Files may include other
+    files, whose labels are namespaced to keep them apart
+
+        include frontend.bdot as fe     # fe.3 is node 3 in frontend.bdot
+'''
+
+import bdgraph
+import hashlib
+import os
+import threading
+
+
+class Source(object):
+    ''' Class
+
+    the parsed contents of one input file. nothing is changed after
+    construction, so one Source may be used by any number of graphs '''
+
+    def __init__(self, contents):
+        ''' string -> Source | BdgraphRuntimeError
+
+        definitions  : list of definition lines
+        options      : list of option strings
+        dependencies : list of (line, requiring labels, providing labels)
+        includes     : list of (file name, namespace) '''
+
+        # clean input, convert to list of lines, remove comments
+        contents = [line.strip() for line in contents.split('\n')]
+        contents = [line for line in contents if line and line[0] != '#']
+
+        self.lines = contents           # list of string
+        self.definitions = []           # list of string
+        self.options = []               # list of string
+        self.dependencies = []          # list of (string, list, list)
+        self.includes = []              # list of (string, string)
+
+        mode = 'definition'             # default parsing state
+
+        for line in contents:
+            # state machine, determine state and then take appropriate action
+            if line in ('options', 'dependencies'):
+                mode = line
+                continue
+
+            if mode == 'definition':
+                if line.split()[0] == 'include':
+                    self.includes.append(Source.parse_include(line))
+                else:
+                    self.definitions.append(line)
+
+            elif mode == 'options':
+                self.options += line.split(' ')
+
+            elif mode == 'dependencies':
+                try:
+                    requiring, providing = Source.parse_dependency(line)
+
+                except bdgraph.BdgraphSyntaxError:
+                    raise bdgraph.BdgraphRuntimeError(
+                        'error: unrecongized dependency type: ' + line)
+
+                self.dependencies.append((line, requiring, providing))
+
+    @staticmethod
+    def parse_include(line):
+        ''' string -> (string, string) | BdgraphRuntimeError
+
+        include directives are in the form:
+            include file_name
+            include file_name as namespace
+
+        the namespace defaults to the file name without its extension '''
+
+        words = line.split()
+
+        if len(words) == 2:
+            name = os.path.basename(words[1])
+            return words[1], os.path.splitext(name)[0]
+
+        if len(words) == 4 and words[2] == 'as':
+            return words[1], words[3]
+
+        raise bdgraph.BdgraphRuntimeError(
+            'error: unrecongized include: ' + line)
+
+    @staticmethod
+    def parse_dependency(line):
+        ''' string -> list of string, list of string | BdgraphSyntaxError
+
+        splits a dependency line into requiring and providing labels. inputs
+        are in the form:
+            1,2,3 -> 4,5,6
+            1,2,3 <- 4,5,6 '''
+
+        left, right = 0, 1
+
+        # determine dependency type
+        require = line.split('<-')
+        allow = line.split('->')
+
+        # 1,2,3 <- 4,5,6
+        if len(require) > 1:
+            requiring_nodes = require[left].split(',')
+            providing_nodes = require[right].split(',')
+
+        # 1,2,3 -> 4,5,6
+        elif len(allow) > 1:
+            providing_nodes = allow[left].split(',')
+            requiring_nodes = allow[right].split(',')
+
+        # unrecongized dependency type
+        else:
+            raise bdgraph.BdgraphSyntaxError
+
+        # clean up labels
+        providing_nodes = [_.strip() for _ in providing_nodes]
+        requiring_nodes = [_.strip() for _ in requiring_nodes]
+
+        return requiring_nodes, providing_nodes
+
+
+class SourceCache(object):
+    ''' Class
+
+    parsed files, keyed by a hash of their contents. keep one of these around
+    between builds and only the files that changed are parsed again '''
+
+    def __init__(self):
+        ''' none -> SourceCache '''
+
+        self.sources = {}               # dict of string: Source
+        self.used = set()               # hashes used since the last prune
+        self.lock = threading.Lock()
+
+    def parse(self, contents):
+        ''' string -> Source | BdgraphRuntimeError
+
+        returns the cached Source for contents, parsing it if it's new. safe
+        to call from several threads '''
+
+        key = hashlib.sha256(contents.encode('utf-8')).hexdigest()
+
+        with self.lock:
+            self.used.add(key)
+            if key in self.sources:
+                return self.sources[key]
+
+        source = Source(contents)
+
+        with self.lock:
+            self.sources[key] = source
+
+        return source
+
+    def prune(self):
+        ''' none -> none
+
+        forgets every file that hasn't been parsed since the last prune, so
+        old versions of files don't pile up '''
+
+        with self.lock:
+            self.sources = {key: source
+                            for key, source in self.sources.items()
+                            if key in self.used}
+            self.used = set()
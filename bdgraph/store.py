@@ -0,0 +1,507 @@
+#!/usr/bin/python3
+''' store.py
+
+Description:
+    A graph kept in a local SQLite file instead of in Node objects, for
+    graphs too big to fit in memory. Input is parsed a line at a time and
+    written in batches, options and reduction run as queries, and output is
+    written straight from query results. Memory use is bounded by the batch
+    size and SQLite's page cache, not the size of the graph
+
+        store = bdgraph.Store('plan.sqlite')
+        store.parse_file('plan.bdot')
+        store.handle_options()
+        store.transitive_reduction()
+        store.write_dot('plan.bdot.dot')
+
+Differences from Graph:
+    Included files aren't supported. Each relationship is written once, under
+    the node providing it, rather than chosen by compress_representation, so
+    the drawing is the same but the order of lines in it isn't. The critical
+    path isn't computed. With the publish option, nodes are named without
+    their numbers at both ends of each relationship
+'''
+
+import bdgraph
+import sqlite3
+
+
+class Store(object):
+    ''' Class
+
+    Nodes, relationships and options of one graph in a SQLite database.
+    Node numbers are the same ones Graph would hand out, and are used as
+    row ids '''
+
+    schema = '''
+        create table if not exists nodes (
+            number integer primary key,
+            label text not null unique,
+            description text not null,
+            pretty text not null,
+            flag text not null,
+            weight real);
+
+        create table if not exists edges (
+            provider integer not null,
+            requirer integer not null,
+            primary key (provider, requirer)) without rowid;
+
+        create table if not exists options (
+            position integer primary key,
+            label text not null);
+    '''
+
+    def __init__(self, file_name=':memory:', batch_size=10000,
+                 logging=False):
+        ''' string, int, bool -> Store
+
+        @file_name  database to use, created if it doesn't exist. a graph
+                    already in it can be used without parsing it again
+        @batch_size rows written or read at a time '''
+
+        self.file_name = file_name
+        self.batch_size = batch_size
+        self.logging = logging
+        self.has_cycle = False
+        self.reduced = False
+        self.truncated = False
+
+        self.db = sqlite3.connect(file_name)
+
+        # this is scratch space, there's nothing to recover after a crash
+        self.db.execute('pragma synchronous = off')
+        self.db.executescript(Store.schema)
+
+    @property
+    def option_strings(self):
+        ''' none -> list of string '''
+
+        return [label for label, in self.db.execute(
+            'select label from options order by position')]
+
+    def close(self):
+        ''' none -> none '''
+
+        self.db.close()
+
+    def parse_file(self, file_name):
+        ''' string -> none | BdgraphRuntimeError
+
+        @file_name  input file to read
+
+        replaces the stored graph with the one in file_name. the file is read
+        a line at a time, with the same sections and syntax as Graph, and
+        written to the database every batch_size lines '''
+
+        with open(file_name, 'r') as fd:
+            self.parse(fd)
+
+    def parse(self, lines):
+        ''' iterable of string -> none | BdgraphRuntimeError
+
+        see parse_file() '''
+
+        db = self.db
+        db.execute('drop index if exists edges_requirer')
+
+        with db:
+            db.execute('delete from nodes')
+            db.execute('delete from edges')
+            db.execute('delete from options')
+
+        db.execute('create temp table if not exists pending ('
+                   'line text, provider text, requirer text)')
+
+        mode = 'definition'
+        number = 1
+        definitions, dependencies, options = [], [], []
+
+        for line in lines:
+            line = line.strip()
+            if not line or line[0] == '#':
+                continue
+
+            if line in ('options', 'dependencies'):
+                mode = line
+                continue
+
+            if mode == 'definition':
+                if line.split()[0] == 'include':
+                    raise bdgraph.BdgraphRuntimeError(
+                        'error: includes are not supported by the store: '
+                        + line)
+
+                definitions.append(self.definition(line, number))
+                number += 1
+
+                if len(definitions) >= self.batch_size:
+                    self.insert_definitions(definitions)
+
+            elif mode == 'options':
+                for option in line.split(' '):
+                    try:
+                        options.append(bdgraph.GraphOption(option).label)
+
+                    except bdgraph.BdgraphSyntaxError:
+                        raise bdgraph.BdgraphRuntimeError(
+                            'error: unrecongized option: ' + option)
+
+            elif mode == 'dependencies':
+                try:
+                    requiring, providing = \
+                        bdgraph.Source.parse_dependency(line)
+
+                except bdgraph.BdgraphSyntaxError:
+                    raise bdgraph.BdgraphRuntimeError(
+                        'error: unrecongized dependency type: ' + line)
+
+                for requirer in requiring:
+                    for provider in providing:
+                        dependencies.append((line, provider, requirer))
+
+                if len(dependencies) >= self.batch_size:
+                    self.insert_definitions(definitions)
+                    self.insert_dependencies(dependencies)
+
+        self.insert_definitions(definitions)
+        self.insert_dependencies(dependencies)
+
+        with db:
+            db.executemany('insert into options (label) values (?)',
+                           [(_,) for _ in options])
+
+        # quicker to build once everything is in
+        db.execute('create index if not exists edges_requirer '
+                   'on edges (requirer, provider)')
+
+        self.has_cycle = False
+        self.reduced = False
+        self.truncated = False
+
+    def definition(self, line, number):
+        ''' string, int -> tuple | BdgraphRuntimeError
+
+        a nodes row for the definition line, parsed by Node '''
+
+        try:
+            node = bdgraph.Node(line, logging=self.logging, number=number)
+
+        except bdgraph.BdgraphSyntaxError:
+            raise bdgraph.BdgraphRuntimeError(
+                'error: unrecongized syntax: ' + line)
+
+        flag = node.node_option.flag if node.node_option else ''
+
+        # generated options don't keep their flag, but must be recognized
+        if node.node_option and node.node_option.type == bdgraph.Option.Next:
+            flag = '_'
+
+        return (number, node.label, node.description, node.pretty_desc, flag,
+                node.weight)
+
+    def insert_definitions(self, rows):
+        ''' list of tuple -> none | BdgraphRuntimeError
+
+        writes a batch of nodes, emptying rows '''
+
+        try:
+            with self.db:
+                self.db.executemany(
+                    'insert into nodes values (?, ?, ?, ?, ?, ?)', rows)
+
+        except sqlite3.IntegrityError:
+            raise bdgraph.BdgraphRuntimeError(
+                'error: duplicate node label in: '
+                + ', '.join(row[1] for row in rows))
+
+        del rows[:]
+
+    def insert_dependencies(self, rows):
+        ''' list of (string, string, string) -> none | BdgraphRuntimeError
+
+        writes a batch of relationships, given by label, emptying rows. the
+        labels are looked up in the database, so every node they refer to
+        must already be written '''
+
+        db = self.db
+
+        with db:
+            db.executemany('insert into pending values (?, ?, ?)', rows)
+
+            missing = db.execute(
+                'select line from pending '
+                'left join nodes p on p.label = pending.provider '
+                'left join nodes r on r.label = pending.requirer '
+                'where p.number is null or r.number is null limit 1'
+            ).fetchone()
+
+            if missing:
+                db.execute('delete from pending')
+                raise bdgraph.BdgraphRuntimeError(
+                    'error: unrecongized node reference: ' + missing[0])
+
+            db.execute(
+                'insert or ignore into edges '
+                'select p.number, r.number from pending '
+                'join nodes p on p.label = pending.provider '
+                'join nodes r on r.label = pending.requirer')
+
+            db.execute('delete from pending')
+
+        del rows[:]
+
+    def handle_options(self):
+        ''' none -> none
+
+        remove_marked and color_next, as in Graph.handle_options(), as
+        queries over the whole graph '''
+
+        db = self.db
+        options = self.option_strings
+
+        with db:
+            if bdgraph.Option.Remove in options:
+                db.execute(
+                    'delete from edges where provider in '
+                    '(select number from nodes where flag = :flag) '
+                    'or requirer in '
+                    '(select number from nodes where flag = :flag)',
+                    {'flag': '&'})
+                db.execute('delete from nodes where flag = ?', ('&',))
+
+            # nodes whose requirements are all complete are next
+            if bdgraph.Option.Next in options:
+                db.execute(
+                    'update nodes set flag = :next where flag = :none and '
+                    'not exists (select 1 from edges '
+                    'join nodes p on p.number = edges.provider '
+                    'where edges.requirer = nodes.number and '
+                    'p.flag != :complete)',
+                    {'next': '_', 'none': '', 'complete': '@'})
+
+    def find_cycle(self):
+        ''' none -> bool
+
+        Kahn's algorithm, batch_size nodes at a time, with the remaining
+        counts in a temporary table. returns whether there's a cycle
+
+        the batch each node was taken in is kept in the temporary levels
+        table. every node's parents were taken in earlier batches '''
+
+        db = self.db
+
+        with db:
+            db.execute('create temp table if not exists levels ('
+                       'number integer primary key, level integer)')
+            db.execute('delete from levels')
+            db.execute('create temp table remaining ('
+                       'number integer primary key, count integer)')
+            db.execute('create temp table ready ('
+                       'number integer primary key)')
+            db.execute('create temp table freed ('
+                       'number integer primary key, count integer)')
+
+            try:
+                db.execute(
+                    'insert into remaining '
+                    'select number, (select count(*) from edges '
+                    'where requirer = number) from nodes')
+                db.execute('create index temp.remaining_count '
+                           'on remaining (count)')
+
+                level = 0
+
+                while True:
+                    db.execute('delete from ready')
+                    found = db.execute(
+                        'insert into ready select number from remaining '
+                        'where count = 0 limit ?', (self.batch_size,))
+
+                    if found.rowcount == 0:
+                        break
+
+                    level += 1
+                    db.execute('insert into levels select number, ? '
+                               'from ready', (level,))
+
+                    # only touch the children of the ready nodes. cross
+                    # join keeps sqlite from scanning edges instead
+                    db.execute('delete from freed')
+                    db.execute(
+                        'insert into freed select edges.requirer, count(*) '
+                        'from ready cross join edges '
+                        'on edges.provider = ready.number '
+                        'group by edges.requirer')
+                    db.execute('delete from remaining '
+                               'where number in (select number from ready)')
+                    db.execute(
+                        'update remaining set count = count - '
+                        '(select count from freed '
+                        'where freed.number = remaining.number) '
+                        'where number in (select number from freed)')
+
+                # anything left over is part of, or depends on, a cycle
+                left, = db.execute(
+                    'select count(*) from remaining').fetchone()
+                return left > 0
+
+            finally:
+                db.execute('drop table temp.remaining')
+                db.execute('drop table temp.ready')
+                db.execute('drop table temp.freed')
+
+    def transitive_reduction(self, budget=None):
+        ''' Budget -> none
+
+        @budget     limits on time and work, and a way to cancel. no limit if
+                    None
+
+        as Graph.transitive_reduction(). for each node with more than one
+        child, everything reachable through its children is found with a
+        recursive query, and the relationships it makes redundant are
+        deleted. nodes are handled batch_size at a time, and SQLite keeps the
+        search in its own temporary storage
+
+        the search doesn't go past the level of the node's furthest child,
+        from find_cycle(), since nothing beyond it can be one of its
+        children '''
+
+        if bdgraph.Option.NoReduce in self.option_strings:
+            return
+
+        if self.find_cycle():
+            self.has_cycle = True
+            return
+
+        db = self.db
+        last = 0
+
+        while True:
+            batch = db.execute(
+                'select provider, max(levels.level) from edges '
+                'join levels on levels.number = edges.requirer '
+                'where provider > ? '
+                'group by provider having count(*) > 1 '
+                'order by provider limit ?',
+                (last, self.batch_size)).fetchall()
+
+            if not batch:
+                break
+
+            for number, top in batch:
+                if budget and not budget.spend():
+                    self.truncated = True
+                    return
+
+                with db:
+                    db.execute(
+                        'delete from edges where provider = :node and '
+                        'requirer in ('
+                        'with recursive reached(number) as ('
+                        'select b.requirer from edges a '
+                        'join edges b on b.provider = a.requirer '
+                        'join levels on levels.number = b.requirer '
+                        'where a.provider = :node and levels.level <= :top '
+                        'union '
+                        'select edges.requirer from reached '
+                        'cross join edges '
+                        'on edges.provider = reached.number '
+                        'join levels on levels.number = edges.requirer '
+                        'where levels.level <= :top) '
+                        'select number from reached)',
+                        {'node': number, 'top': top})
+
+            last = batch[-1][0]
+
+        self.reduced = True
+
+    def write_dot(self, file_name):
+        ''' string -> bool, IO
+
+        @file_name  name of the output graphviz file to write
+
+        writes the graph in graphviz dot format, in the same style as
+        Graph.write_dot(). nodes and relationships are read in order from
+        two queries and written as they come, and the file is only replaced
+        if its contents changed. returns whether it was '''
+
+        return bdgraph.Renderer.stream_if_changed(file_name, self.write)
+
+    def write(self, fd):
+        ''' file descriptor -> IO
+
+        see write_dot() '''
+
+        options = self.option_strings
+        option_labels = ' '.join(options)
+        colors = {}
+
+        # unlike Graph, both ends of a relationship are named the same way
+        name = '"%s (%s)"'
+        if bdgraph.Option.Publish in options:
+            name = '"%s%.0s"'
+
+        fd.write('digraph g{\n'
+                 '  rankdir=LR;\n'
+                 '  ratio=fill;\n'
+                 '  node [style=filled];\n'
+                 '  overlap=false;\n')
+
+        if bdgraph.Option.Circular in options:
+            fd.write('  layout=neato;\n')
+
+        nodes = self.db.execute(
+            'select number, pretty, flag from nodes order by number')
+        edges = self.db.execute(
+            'select edges.provider, nodes.number, nodes.pretty from edges '
+            'join nodes on nodes.number = edges.requirer '
+            'order by edges.provider, edges.requirer')
+
+        edge = edges.fetchone()
+
+        for number, pretty, flag in nodes:
+            left = name % (pretty, number)
+
+            while edge and edge[0] == number:
+                fd.write('  %s -> %s\n' % (left, name % (edge[2], edge[1])))
+                edge = edges.fetchone()
+
+            if flag:
+                if flag not in colors:
+                    colors[flag] = bdgraph.NodeOption(flag)
+
+                if colors[flag].type in option_labels:
+                    left += ' ' + colors[flag].color
+
+            fd.write('  ' + left + '\n')
+
+        fd.write('}\n')
+
+    def edges(self):
+        ''' none -> iterator of (string, string)
+
+        every relationship as (providing label, requiring label), read
+        batch_size rows at a time '''
+
+        cursor = self.db.execute(
+            'select p.label, r.label from edges '
+            'join nodes p on p.number = edges.provider '
+            'join nodes r on r.number = edges.requirer')
+
+        while True:
+            rows = cursor.fetchmany(self.batch_size)
+            if not rows:
+                break
+
+            for row in rows:
+                yield row
+
+    def count(self):
+        ''' none -> int, int
+
+        number of nodes and relationships '''
+
+        nodes, = self.db.execute('select count(*) from nodes').fetchone()
+        edges, = self.db.execute('select count(*) from edges').fetchone()
+        return nodes, edges
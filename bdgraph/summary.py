@@ -0,0 +1,314 @@
+#!/usr/bin/python3
+''' summary.py
+
+Description:
+    Shrinks oversized graphs by collapsing groups of nodes into single
+    cluster nodes, until the graph fits a node budget. Groups are collapsed
+    in order of how little they hide:
+
+        cycles      strongly connected components
+        chains      runs of nodes with one parent and one child, longest first
+        twins       nodes with exactly the same parents and children, largest
+                    groups first
+        subtrees    nodes whose descendants have no other parents, or whose
+                    ancestors have no other children, smallest first, so
+                    bigger subtrees swallow smaller clusters
+        layers      nodes the same distance from the top of the graph,
+                    largest layers first. this hides the most, but always
+                    works unless the graph is one long path
+'''
+
+import bdgraph
+import heapq
+
+
+class Summarizer(object):
+    ''' Class
+
+    Collapses nodes of a Graph in place. Cluster nodes keep the nodes they
+    stand for in Node.members, with only the relationships between members
+    left on them, so the cluster can be written out in full later '''
+
+    def __init__(self, graph):
+        ''' Graph -> Summarizer '''
+
+        self.graph = graph
+        self.owner = {}             # dict of Node: Node, member to cluster
+
+    def summarize(self, budget):
+        ''' int -> int
+
+        collapses nodes until there are at most budget of them, or there's
+        nothing left to collapse. returns the number of nodes left '''
+
+        graph = self.graph
+
+        if graph.compressed:
+            graph.expand_representation()
+
+        stages = [self.collapse_cycles, self.collapse_chains,
+                  self.collapse_twins, self.collapse_subtrees,
+                  self.collapse_layers]
+
+        # merging cycles and layers can leave redundant relationships, which
+        # hide chains and subtrees
+        reduce_after = [self.collapse_cycles, self.collapse_layers]
+        reduced = bdgraph.Option.NoReduce not in graph.option_strings
+
+        if reduced and not graph.reduced:
+            graph.transitive_reduction()
+
+        # collapsing can expose new groups, so go around until nothing changes
+        before = None
+
+        while before != len(graph.nodes):
+            before = len(graph.nodes)
+
+            for stage in stages:
+                if len(graph.nodes) <= budget:
+                    break
+
+                stage(budget)
+                self.rebuild()
+
+                if reduced and stage in reduce_after:
+                    graph.transitive_reduction()
+
+        graph.reachability = None
+        return len(graph.nodes)
+
+    def collapse_cycles(self, budget):
+        ''' int -> none
+
+        every cycle becomes a single node, regardless of the budget, and
+        nodes requiring themselves no longer do. this means the stages after
+        this one only see a DAG '''
+
+        position = {node: i for i, node in enumerate(self.graph.nodes)}
+
+        for node in self.graph.nodes:
+            if node in node.provides:
+                node.provides.remove(node)
+                node.requires.remove(node)
+
+        for component in self.graph.strongly_connected_components():
+            component.sort(key=position.get)
+
+            if len(component) > 1:
+                self.collapse(component, '%s (cycle of %d nodes)' % (
+                    self.name(component[0]), self.size(component)))
+
+    def collapse_chains(self, budget):
+        ''' int -> none
+
+        runs of nodes where each has a single child, which has no other
+        parent. only the first node may have other parents, and only the last
+        node other children '''
+
+        def linked(node):
+            return (len(node.provides) == 1 and
+                    len(node.provides[0].requires) == 1)
+
+        chains = []
+
+        for node in self.graph.nodes:
+            # only start from the head of a chain
+            if len(node.requires) == 1 and linked(node.requires[0]):
+                continue
+
+            chain = [node]
+            while linked(chain[-1]):
+                chain.append(chain[-1].provides[0])
+
+            if len(chain) > 1:
+                chains.append(chain)
+
+        chains.sort(key=len, reverse=True)
+        remaining = len(self.graph.nodes)
+
+        for chain in chains:
+            if remaining <= budget:
+                break
+
+            # only merge as much of the chain as needed
+            chain = chain[:remaining - budget + 1]
+
+            self.collapse(chain, '%s ... %s (%d nodes)' % (
+                self.name(chain[0]), self.name(chain[-1]), self.size(chain)))
+            remaining -= len(chain) - 1
+
+    def collapse_twins(self, budget):
+        ''' int -> none
+
+        nodes with the same parents and the same children are interchangeable
+        in the drawing, so nothing about the structure is lost '''
+
+        groups = {}
+
+        for node in self.graph.nodes:
+            key = (frozenset(node.requires), frozenset(node.provides))
+            groups.setdefault(key, []).append(node)
+
+        twins = [group for group in groups.values() if len(group) > 1]
+        twins.sort(key=len, reverse=True)
+        remaining = len(self.graph.nodes)
+
+        for group in twins:
+            if remaining <= budget:
+                break
+
+            self.collapse(group, self.describe(group))
+            remaining -= len(group) - 1
+
+    def collapse_subtrees(self, budget):
+        ''' int -> none
+
+        a node whose descendants all have exactly one parent is the root of a
+        subtree that only connects to the rest of the graph through its root.
+        the same goes for a node whose ancestors all have exactly one child.
+        these are collapsed smallest first, until the budget is met '''
+
+        order = self.graph.topological_order()
+        candidates = []
+
+        for follow, back, nodes in (('provides', 'requires', reversed(order)),
+                                    ('requires', 'provides', order)):
+            closed = {}
+            size = {}
+
+            for node in nodes:
+                closed[node] = all(len(getattr(other, back)) == 1 and
+                                   closed[other]
+                                   for other in getattr(node, follow))
+                size[node] = 1 + sum(size[other]
+                                     for other in getattr(node, follow))
+
+                if closed[node] and size[node] > 1:
+                    candidates.append(
+                        (size[node], len(candidates), node, follow, back))
+
+        heapq.heapify(candidates)
+        remaining = len(self.graph.nodes)
+
+        while candidates and remaining > budget:
+            _, _, root, follow, back = heapq.heappop(candidates)
+
+            # swallowed by a subtree collapsed earlier
+            if root in self.owner:
+                continue
+
+            members = [root]
+            for member in members:
+                members.extend(getattr(member, follow))
+
+            # no longer a subtree after earlier collapses
+            if any(len(getattr(member, back)) != 1 for member in members[1:]):
+                continue
+
+            self.collapse(members, self.describe(members))
+            remaining -= len(members) - 1
+
+    def collapse_layers(self, budget):
+        ''' int -> none
+
+        every relationship goes from a shallower node to a deeper one, so
+        merging nodes of the same depth can't create a cycle '''
+
+        layers = {}
+
+        for node, depth in self.graph.depths().items():
+            layers.setdefault(depth, []).append(node)
+
+        widest = sorted(layers.items(), key=lambda item: len(item[1]),
+                        reverse=True)
+        remaining = len(self.graph.nodes)
+
+        for depth, layer in widest:
+            if remaining <= budget or len(layer) < 2:
+                break
+
+            # only merge as much of the layer as needed
+            layer = layer[:remaining - budget + 1]
+
+            self.collapse(layer, self.describe(layer))
+            remaining -= len(layer) - 1
+
+    def name(self, node):
+        ''' Node -> string
+
+        the description of the first real node a node stands for '''
+
+        while node.members:
+            node = node.members[0]
+
+        return node.description
+
+    def size(self, nodes):
+        ''' list of Node -> int
+
+        how many real nodes the given nodes stand for '''
+
+        return sum(self.size(node.members) if node.members else 1
+                   for node in nodes)
+
+    def describe(self, members):
+        ''' list of Node -> string
+
+        description for a cluster of the given members '''
+
+        return '%s (+%d nodes)' % (self.name(members[0]),
+                                   self.size(members) - 1)
+
+    def collapse(self, members, description):
+        ''' list of Node, string -> Node
+
+        replaces members with a new cluster node. relationships between the
+        members stay on them, relationships with the rest of the graph move
+        to the cluster node. the graph's node list is fixed up by rebuild() '''
+
+        graph = self.graph
+        inside = set(members)
+        cluster = graph.new_node('cluster' + str(graph.node_counter),
+                                 description)
+        cluster.members = list(members)
+
+        for member in members:
+            self.owner[member] = cluster
+            graph.forget_label(member)
+
+            for parent in member.requires:
+                if parent not in inside:
+                    parent.provides.remove(member)
+                    parent.add_provide(cluster)
+                    cluster.add_require(parent)
+
+            for child in member.provides:
+                if child not in inside:
+                    child.requires.remove(member)
+                    child.add_require(cluster)
+                    cluster.add_provide(child)
+
+            member.provides = [_ for _ in member.provides if _ in inside]
+            member.requires = [_ for _ in member.requires if _ in inside]
+
+        graph.labels[cluster.label] = cluster
+        return cluster
+
+    def rebuild(self):
+        ''' none -> none
+
+        replaces collapsed nodes in the graph's node list with their cluster,
+        which takes the place of its first member '''
+
+        result = []
+        seen = set()
+
+        for node in self.graph.nodes:
+            while node in self.owner:
+                node = self.owner[node]
+
+            if node not in seen:
+                seen.add(node)
+                result.append(node)
+
+        self.graph.nodes = result
@@ -1,9 +1,20 @@
 #!/usr/bin/python3
 
+import concurrent.futures
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
 import unittest
-from bdgraph import Node, NodeOption
+import unittest.mock
+from bdgraph import Node, NodeOption, Reachability, Renderer, SourceCache
+from bdgraph import Budget, Exporter, Layout, Store
 from bdgraph import Graph, GraphOption
 from bdgraph import BdgraphRuntimeError, BdgraphNodeNotFound
+from bdgraph import BdgraphGraphLoopDetected
+from bdgraph.fuzz import Fuzzer
 
 template = '''
 {h}
@@ -111,6 +122,1121 @@ class TestGraph(unittest.TestCase):
         pass
 
 
+class TestAnalytics(unittest.TestCase):
+    ''' topological order, depth, height, critical path '''
+
+    def setUp(self):
+        self.graph = Graph(read_graph('example.bdot'))
+        self.graph.transitive_reduction()
+
+    def labels(self, nodes):
+        return [node.label for node in nodes]
+
+    def test_topological_order(self):
+        order = self.labels(self.graph.topological_order())
+        self.assertEqual(sorted(order), sorted(self.labels(self.graph.nodes)))
+
+        for parent, child in self.graph.edges():
+            self.assertLess(
+                order.index(parent.label), order.index(child.label))
+
+    def test_topological_order_cycle(self):
+        graph = Graph(template.format(
+            h='1: apple\n2: sauce', o='', d='1 -> 2\n2 -> 1'))
+
+        with self.assertRaises(BdgraphGraphLoopDetected):
+            graph.topological_order()
+
+    def test_depths_heights(self):
+        depths = self.graph.depths()
+        heights = self.graph.heights()
+        find = self.graph.find_node
+
+        self.assertEqual(depths[find('1')], 0)
+        self.assertEqual(depths[find('9')], 4)
+        self.assertEqual(heights[find('9')], 0)
+        self.assertEqual(heights[find('6')], 3)
+
+    def test_critical_path(self):
+        path, length = self.graph.critical_path()
+        self.assertEqual(self.labels(path), ['1', '3', '4', '5', '9'])
+        self.assertEqual(length, 5)
+
+    def test_critical_path_weights(self):
+        path, length = self.graph.critical_path({'8': 10})
+        self.assertEqual(self.labels(path), ['6', '8', '5', '9'])
+        self.assertEqual(length, 13)
+
+    def test_critical_path_definition_weights(self):
+        graph = Graph(template.format(
+            h='1: a [2]\n2: b [0.5]\n3: c', o='', d='3 <- 1,2'))
+        path, length = graph.critical_path()
+
+        self.assertEqual(self.labels(path), ['1', '3'])
+        self.assertEqual(length, 3)
+        self.assertEqual(graph.find_node('1').description, 'a')
+
+    def test_weights_round_trip(self):
+        weights = ['2', '0.5', '1234567', '0.0000001', '12345678901.25']
+        graph = Graph(template.format(
+            h='\n'.join('%d: node [%s]' % (i, weight)
+                        for i, weight in enumerate(weights, 1)),
+            o='', d=''))
+        again = Graph(graph.format_config())
+
+        self.assertEqual([_.weight for _ in again.nodes],
+                         [float(_) for _ in weights])
+        self.assertEqual([_.description for _ in again.nodes],
+                         ['node'] * len(weights))
+        self.assertIn('   4: node [0.0000001]', graph.format_config())
+
+    def test_compressed_edges(self):
+        before = len(self.graph.edges())
+        self.graph.compress_representation()
+        self.assertEqual(len(self.graph.edges()), before)
+
+
+def random_graph(seed, size=30, edges=60):
+    ''' int, int, int -> string
+
+    a random graph in input format, may have cycles '''
+
+    rng = random.Random(seed)
+    definitions = '\n'.join('%d: node %d' % (i, i) for i in range(1, size + 1))
+    dependencies = '\n'.join(
+        '%d -> %d' % (rng.randint(1, size), rng.randint(1, size))
+        for _ in range(edges))
+
+    return template.format(h=definitions, o='', d=dependencies)
+
+
+def walk_descendants(graph, node):
+    ''' Graph, Node -> set of Node
+
+    every node reachable from node, found the slow way '''
+
+    children, _ = graph.adjacency()
+    seen = set()
+    todo = list(children[node])
+
+    while todo:
+        current = todo.pop()
+        if current not in seen:
+            seen.add(current)
+            todo.extend(children[current])
+
+    return seen
+
+
+class TestReachability(unittest.TestCase):
+    ''' reachability index '''
+
+    def test_depends_on(self):
+        graph = Graph(read_graph('example.bdot'))
+        graph.transitive_reduction()
+
+        self.assertTrue(graph.depends_on('9', '1'))
+        self.assertTrue(graph.depends_on('9', '6'))
+        self.assertFalse(graph.depends_on('1', '9'))
+        self.assertFalse(graph.depends_on('7', '1'))
+        self.assertFalse(graph.depends_on('1', '1'))
+
+    def test_ancestors_descendants(self):
+        graph = Graph(read_graph('example.bdot'))
+        labels = lambda nodes: sorted(node.label for node in nodes)
+
+        self.assertEqual(labels(graph.ancestors('5')), ['1', '2', '3', '4',
+                                                        '6', '8'])
+        self.assertEqual(labels(graph.descendants('6')), ['5', '7', '8', '9'])
+        self.assertEqual(graph.ancestors('1'), [])
+
+    def test_cycle(self):
+        graph = Graph(template.format(
+            h='1: a\n2: b\n3: c', o='', d='1 -> 2\n2 -> 1\n2 -> 3'))
+
+        self.assertTrue(graph.depends_on('1', '1'))
+        self.assertTrue(graph.depends_on('1', '2'))
+        self.assertTrue(graph.depends_on('3', '1'))
+        self.assertFalse(graph.depends_on('1', '3'))
+
+    def test_against_walk(self):
+        for seed in range(10):
+            graph = Graph(random_graph(seed))
+
+            for mode in ('chains', 'bitsets', 'search'):
+                index = Reachability(graph, max_bytes=0)
+                if mode != 'search':
+                    getattr(index, 'build_' + mode)()
+                self.assertEqual(index.mode, mode)
+
+                for node in graph.nodes:
+                    expected = walk_descendants(graph, node)
+                    self.assertEqual(set(index.descendants(node)), expected)
+
+                    for other in graph.nodes:
+                        self.assertEqual(index.depends_on(other, node),
+                                         other in expected)
+                        self.assertEqual(node in index.ancestors(other),
+                                         other in expected)
+
+    def test_memory_bound(self):
+        graph = Graph(read_graph('example.bdot'))
+
+        # too big to index, queries search instead
+        self.assertEqual(graph.build_reachability(max_bytes=16).mode,
+                         'search')
+        self.assertTrue(graph.depends_on('9', '1'))
+        self.assertFalse(graph.depends_on('7', '1'))
+        self.assertEqual(sorted(_.label for _ in graph.ancestors('5')),
+                         ['1', '2', '3', '4', '6', '8'])
+
+    def test_chains(self):
+        graph = Graph(template.format(
+            h='1: a\n2: b\n3: c\n4: d\n5: e', o='',
+            d='1 -> 3\n2 -> 3\n3 -> 4\n3 -> 5'))
+        index = Reachability(graph)
+
+        # three paths, but 2 reaches 5 through the other chain's 3
+        self.assertEqual(len(index.chains), 2)
+
+
+def random_dag(seed, size=25, edges=50):
+    ''' int, int, int -> list of (int, int)
+
+    random edges that don't form a cycle '''
+
+    rng = random.Random(seed)
+    result = []
+
+    for _ in range(edges):
+        a, b = rng.sample(range(1, size + 1), 2)
+        result.append((min(a, b), max(a, b)))
+
+    return result
+
+
+def dag_text(edges, size=25):
+    ''' list of (int, int), int -> string
+
+    nodes 1 through size, with the given relationships '''
+
+    definitions = '\n'.join('%d: node %d' % (i, i) for i in range(1, size + 1))
+    dependencies = '\n'.join('%d -> %d' % edge for edge in edges)
+    return template.format(h=definitions, o='', d=dependencies)
+
+
+def dag_graph(edges, size=25, reduce=False):
+    ''' list of (int, int), int, bool -> Graph
+
+    see dag_text(), optionally transitively reduced '''
+
+    graph = Graph(dag_text(edges, size))
+    if reduce:
+        graph.transitive_reduction()
+    return graph
+
+
+def edge_labels(graph):
+    ''' Graph -> set of (string, string) '''
+    return set((a.label, b.label) for a, b in graph.edges())
+
+
+class TestEditing(unittest.TestCase):
+    ''' adding and removing nodes and edges '''
+
+    def test_add_edge_matches_rebuild(self):
+        for seed in range(10):
+            edges = random_dag(seed)
+            graph = dag_graph(edges[:10], reduce=True)
+
+            for a, b in edges[10:]:
+                graph.add_edge(str(a), str(b))
+
+            expected = edge_labels(dag_graph(edges, reduce=True))
+            self.assertEqual(edge_labels(graph), expected)
+
+    def test_remove_edge_matches_rebuild(self):
+        for seed in range(10):
+            edges = sorted(set(random_dag(seed)))
+            graph = dag_graph(edges, reduce=True)
+            random.Random(seed).shuffle(edges)
+
+            for a, b in edges[:10]:
+                graph.remove_edge(str(a), str(b))
+
+            expected = edge_labels(dag_graph(edges[10:], reduce=True))
+            self.assertEqual(edge_labels(graph), expected)
+
+    def test_remove_node_matches_rebuild(self):
+        for seed in range(10):
+            edges = random_dag(seed)
+            graph = dag_graph(edges, reduce=True)
+
+            for label in (3, 7, 12):
+                graph.remove_node(str(label))
+
+            rest = [(a, b) for a, b in edges
+                    if a not in (3, 7, 12) and b not in (3, 7, 12)]
+            expected = edge_labels(dag_graph(rest, reduce=True))
+            self.assertEqual(edge_labels(graph), expected)
+
+    def test_remove_restores_implied(self):
+        graph = dag_graph([(1, 2), (2, 3), (1, 3)], reduce=True)
+        graph.remove_edge('2', '3')
+
+        self.assertEqual(edge_labels(graph), set([('1', '2'), ('1', '3')]))
+        self.assertTrue(graph.depends_on('3', '1'))
+
+        graph = dag_graph([(1, 2), (2, 3), (1, 3)], reduce=True)
+        graph.remove_node('2')
+        self.assertEqual(edge_labels(graph), set([('1', '3')]))
+
+    def test_add_implied_edge(self):
+        graph = dag_graph([(1, 2), (2, 3)], reduce=True)
+        graph.add_edge('1', '3')
+        self.assertEqual(edge_labels(graph), set([('1', '2'), ('2', '3')]))
+
+    def test_add_edge_cycle(self):
+        graph = dag_graph([(1, 2), (2, 3)], reduce=True)
+        graph.add_edge('3', '1')
+
+        self.assertTrue(graph.has_cycle)
+        self.assertTrue(graph.depends_on('1', '3'))
+        self.assertIn(('3', '1'), edge_labels(graph))
+
+    def test_add_edge_compressed(self):
+        graph = dag_graph([(1, 2), (2, 3), (1, 4)], reduce=True)
+        graph.compress_representation()
+        graph.add_edge('3', '4')
+
+        self.assertFalse(graph.compressed)
+        self.assertEqual(edge_labels(graph),
+                         set([('1', '2'), ('2', '3'), ('3', '4')]))
+
+    def test_reduce_compressed(self):
+        graph = Graph.from_nodes_edges(
+            [('1', 'a'), ('2', 'b'), ('3', 'c')],
+            [('1', '2'), ('2', '3'), ('1', '3')])
+        graph.compress_representation()
+        graph.transitive_reduction()
+
+        self.assertFalse(graph.compressed)
+        self.assertEqual(edge_labels(graph), set([('1', '2'), ('2', '3')]))
+
+    def test_remove_edge(self):
+        graph = dag_graph([(1, 2), (2, 3)], reduce=True)
+        graph.remove_edge('2', '3')
+        graph.remove_edge('1', '3')
+
+        self.assertEqual(edge_labels(graph), set([('1', '2')]))
+        self.assertFalse(graph.depends_on('3', '1'))
+
+    def test_add_remove_node(self):
+        graph = dag_graph([(1, 2), (2, 3)], reduce=True)
+        graph.add_node('30: @new node')
+        graph.add_edge('3', '30')
+        graph.remove_node('2')
+
+        self.assertEqual(graph.find_node('30').description, 'new node')
+        self.assertEqual(edge_labels(graph), set([('3', '30')]))
+
+        with self.assertRaises(BdgraphNodeNotFound):
+            graph.find_node('2')
+
+        with self.assertRaises(BdgraphRuntimeError):
+            graph.add_node('30: duplicate')
+
+
+def pipeline(contents):
+    ''' string -> string, string
+
+    run everything bdot does, return the dot and config output '''
+
+    graph = Graph(contents)
+    graph.handle_options()
+    graph.transitive_reduction()
+    graph.compress_representation()
+
+    return graph.format_dot(), graph.format_config()
+
+
+class TestConcurrency(unittest.TestCase):
+    ''' graphs built at the same time don't interfere '''
+
+    def test_interleaved_numbering(self):
+        first = Graph(simple)
+        second = Graph(simple)
+        first.add_node('3: later')
+
+        self.assertEqual([_.number for _ in first.nodes], ['1', '2', '3'])
+        self.assertEqual([_.number for _ in second.nodes], ['1', '2'])
+
+    def test_threads(self):
+        inputs = [read_graph(name) for name in
+                  ('simple.bdot', 'example.bdot', 'references.bdot')]
+        inputs += [random_graph(seed, size=60, edges=120)
+                   for seed in range(20)]
+        inputs *= 4
+
+        serial = [pipeline(contents) for contents in inputs]
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=8) as pool:
+            parallel = list(pool.map(pipeline, inputs))
+
+        self.assertEqual(parallel, serial)
+
+
+class TestInclude(unittest.TestCase):
+    ''' graphs spread over several files '''
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.write('main.bdot', template.format(
+            h='1: ship it\ninclude teams/front.bdot as fe\ninclude back.bdot',
+            o='color_next', d='1 <- fe.2, back.1'))
+        self.write('teams/front.bdot', template.format(
+            h='1: design\n2: build', o='', d='1 -> 2'))
+        self.write('back.bdot', template.format(
+            h='1: api\ninclude db.bdot as db', o='', d='1 <- db.1'))
+        self.write('db.bdot', template.format(h='1: schema', o='', d=''))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, name, contents):
+        path = os.path.join(self.directory.name, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as fd:
+            fd.write(contents)
+
+    def load(self, cache=None):
+        path = os.path.join(self.directory.name, 'main.bdot')
+        return Graph.from_file(path, cache=cache)
+
+    def test_namespaces(self):
+        graph = self.load()
+
+        self.assertEqual([_.label for _ in graph.nodes],
+                         ['1', 'fe.1', 'fe.2', 'back.1', 'back.db.1'])
+        self.assertEqual([_.number for _ in graph.nodes],
+                         ['1', '2', '3', '4', '5'])
+        self.assertEqual(len(graph.included), 3)
+        self.assertEqual(graph.option_strings, ['color_next'])
+
+        self.assertTrue(graph.depends_on('1', 'fe.1'))
+        self.assertTrue(graph.depends_on('1', 'back.db.1'))
+        self.assertFalse(graph.depends_on('fe.2', 'back.1'))
+
+    def test_cache(self):
+        cache = SourceCache()
+        first = self.load(cache)
+        parsed = dict(cache.sources)
+
+        self.write('back.bdot', template.format(
+            h='1: api v2\ninclude db.bdot as db', o='', d='1 <- db.1'))
+        cache.prune()
+        second = self.load(cache)
+
+        # only the changed file was parsed again
+        self.assertEqual(len(parsed), 4)
+        self.assertEqual(len(set(cache.sources) - set(parsed)), 1)
+        self.assertEqual(len(set(parsed) - set(cache.sources)), 0)
+        self.assertEqual(second.find_node('back.1').description, 'api v2')
+        self.assertEqual(first.find_node('back.1').description, 'api')
+
+        cache.prune()
+        self.assertEqual(len(cache.sources), 4)
+
+    def test_include_cycle(self):
+        self.write('db.bdot', template.format(
+            h='1: schema\ninclude main.bdot as loop', o='', d=''))
+
+        with self.assertRaises(BdgraphRuntimeError):
+            self.load()
+
+    def test_missing_include(self):
+        self.write('db.bdot', template.format(
+            h='include missing.bdot', o='', d=''))
+
+        with self.assertRaises(BdgraphRuntimeError):
+            self.load()
+
+
+class TestFocus(unittest.TestCase):
+    ''' cutting the graph down to one node's neighborhood '''
+
+    def focus(self, *args):
+        graph = Graph(read_graph('example.bdot'))
+        graph.focus(*args)
+        return graph
+
+    def test_down(self):
+        graph = self.focus('6')
+        self.assertEqual([_.label for _ in graph.nodes],
+                         ['5', '6', '7', '8', '9'])
+
+    def test_up_depth(self):
+        graph = self.focus('5', 1, 'up')
+        self.assertEqual([_.label for _ in graph.nodes], ['4', '5', '8'])
+        self.assertEqual(edge_labels(graph), set([('4', '5'), ('8', '5')]))
+
+        with self.assertRaises(BdgraphNodeNotFound):
+            graph.find_node('3')
+
+    def test_pipeline(self):
+        graph = self.focus('3', 2)
+        graph.handle_options()
+        graph.transitive_reduction()
+        graph.compress_representation()
+
+        self.assertEqual(edge_labels(graph), set([('3', '4'), ('4', '5')]))
+
+    def test_colors(self):
+        # with 4 and 8 removed, 5 is next even though they're cut off
+        contents = read_graph('example.bdot').replace(
+            'cleanup', 'remove_marked')
+        contents = contents.replace('4: ', '4: &').replace('8: ', '8: &')
+
+        whole = Graph(contents)
+        whole.handle_options()
+        colors = {node.label: Layout.color(node, whole.option_strings)
+                  for node in whole.nodes}
+
+        for label in colors:
+            for direction in ('up', 'down'):
+                graph = Graph(contents)
+                graph.focus(label, None, direction)
+                graph.handle_options()
+
+                for node in graph.nodes:
+                    self.assertEqual(
+                        Layout.color(node, graph.option_strings),
+                        colors[node.label], (label, direction, node.label))
+
+    def test_missing(self):
+        with self.assertRaises(BdgraphNodeNotFound):
+            self.focus('42')
+
+    def test_bad_direction(self):
+        with self.assertRaises(BdgraphRuntimeError):
+            self.focus('2', None, 'sideways')
+
+
+class TestRender(unittest.TestCase):
+    ''' rendering and only writing what changed '''
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.dot = os.path.join(self.directory.name, 'graph.bdot.dot')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_write_dot_unchanged(self):
+        graph = Graph(read_graph('example.bdot'))
+        self.assertTrue(graph.write_dot(self.dot))
+        before = os.stat(self.dot)
+
+        self.assertFalse(Graph(read_graph('example.bdot')).write_dot(self.dot))
+        self.assertEqual(os.stat(self.dot).st_ino, before.st_ino)
+        self.assertEqual(os.stat(self.dot).st_mtime, before.st_mtime)
+
+        self.assertTrue(Graph(simple).write_dot(self.dot))
+        self.assertEqual(os.listdir(self.directory.name), ['graph.bdot.dot'])
+
+    def test_write_config_unchanged(self):
+        config = os.path.join(self.directory.name, 'graph.bdot')
+        graph = Graph(read_graph('example.bdot'))
+
+        self.assertTrue(graph.write_config(config))
+        self.assertFalse(graph.write_config(config))
+
+    def test_output_name(self):
+        self.assertEqual(Renderer.output_name('a.bdot.dot', 'svg'),
+                         'a.bdot.svg')
+        self.assertEqual(Renderer.output_name('a.gv', 'png'), 'a.gv.png')
+
+    def test_up_to_date(self):
+        Graph(simple).write_dot(self.dot)
+        svg = Renderer.output_name(self.dot, 'svg')
+        Renderer.write_if_changed(svg, '<svg/>')
+
+        later = os.stat(self.dot).st_mtime + 10
+        os.utime(svg, (later, later))
+
+        # graphviz isn't needed when the output is newer than the dot file
+        renderer = Renderer(binary='bdgraph-missing-binary')
+        self.assertEqual(renderer.render([self.dot]), [(svg, False)])
+
+    def test_missing_binary(self):
+        Graph(simple).write_dot(self.dot)
+        renderer = Renderer(binary='bdgraph-missing-binary')
+
+        with self.assertRaises(BdgraphRuntimeError):
+            renderer.render([self.dot])
+
+    @unittest.skipUnless(shutil.which('dot'), 'graphviz is not installed')
+    def test_render(self):
+        Graph(simple).write_dot(self.dot)
+        renderer = Renderer(formats=['svg', 'png'], workers=2)
+
+        results = renderer.render([self.dot])
+        self.assertEqual([changed for _, changed in results], [True, True])
+
+        os.utime(self.dot)
+        results = renderer.render([self.dot])
+        self.assertEqual([changed for _, changed in results], [False, False])
+
+
+class TestBulk(unittest.TestCase):
+    ''' building graphs from data instead of text '''
+
+    def test_matches_parsed(self):
+        for seed in range(5):
+            edges = random_dag(seed)
+            nodes = [(i, 'node %d' % i) for i in range(1, 26)]
+
+            graph = Graph.from_nodes_edges(nodes, edges)
+            self.assertEqual(edge_labels(graph),
+                             edge_labels(dag_graph(edges)))
+
+            graph.transitive_reduction()
+            graph.compress_representation()
+            self.assertEqual(graph.format_dot(), pipeline(dag_text(edges))[0])
+
+    def test_options_and_flags(self):
+        graph = Graph.from_nodes_edges(
+            {'a': '@done', 'b': 'next [3]', 'c': 'later'},
+            [('a', 'b'), ('b', 'c'), ('a', 'b')],
+            options=['color_next', 'color_complete'])
+        graph.handle_options()
+
+        self.assertEqual(graph.option_strings,
+                         ['color_next', 'color_complete'])
+        self.assertEqual(graph.find_node('b').node_option.type, 'color_next')
+        self.assertEqual(graph.find_node('b').weight, 3)
+        self.assertEqual(len(graph.edges()), 2)
+
+    def test_adjacency(self):
+        graph = Graph.from_adjacency({'a': ['b', 'c'], 'b': ['c']},
+                                     descriptions={'a': 'start'})
+
+        self.assertEqual([_.description for _ in graph.nodes],
+                         ['start', 'b', 'c'])
+        self.assertTrue(graph.depends_on('c', 'a'))
+
+    def test_errors(self):
+        with self.assertRaises(BdgraphRuntimeError):
+            Graph.from_nodes_edges({'a': 'x'}, [('a', 'b')])
+
+        with self.assertRaises(BdgraphRuntimeError):
+            Graph.from_nodes_edges({'a': 'x'}, [], options=['bogus'])
+
+        with self.assertRaises(BdgraphRuntimeError):
+            Graph.from_nodes_edges([('a', 'x'), ('a', 'y')], [])
+
+
+class TestSummary(unittest.TestCase):
+    ''' collapsing big graphs into summary nodes '''
+
+    def test_under_budget(self):
+        graph = Graph(read_graph('example.bdot'))
+        self.assertEqual(graph.summarize(20), 9)
+        self.assertFalse(any(node.members for node in graph.nodes))
+
+    def test_chain(self):
+        graph = Graph.from_adjacency({'a': ['b'], 'b': ['c'], 'c': ['d']})
+        graph.transitive_reduction()
+
+        self.assertEqual(graph.summarize(2), 2)
+        self.assertEqual([_.description for _ in graph.nodes],
+                         ['a ... c (3 nodes)', 'd'])
+
+    def test_cycle(self):
+        graph = Graph(template.format(
+            h='1: a\n2: b\n3: c', o='', d='1 -> 2\n2 -> 1\n2 -> 3'))
+        graph.transitive_reduction()
+
+        self.assertEqual(graph.summarize(2), 2)
+        self.assertEqual(graph.nodes[0].description, 'a (cycle of 2 nodes)')
+        graph.topological_order()
+
+    def test_twins(self):
+        graph = Graph.from_adjacency(
+            {'a': ['x', 'y', 'z'], 'x': ['b'], 'y': ['b'], 'z': ['b']})
+        graph.transitive_reduction()
+
+        self.assertEqual(graph.summarize(3), 3)
+        self.assertEqual(graph.nodes[1].description, 'x (+2 nodes)')
+
+    def test_random_budgets(self):
+        for seed in range(10):
+            graph = Graph(random_graph(seed, size=60, edges=90))
+            original = Graph(random_graph(seed, size=60, edges=90))
+            graph.transitive_reduction()
+
+            self.assertLessEqual(graph.summarize(8), 8)
+            graph.topological_order()
+
+            # every original relationship survives between the clusters
+            top = {}
+            for node in graph.nodes:
+                todo = [node]
+                for member in todo:
+                    top[member.label] = node.label
+                    todo.extend(member.members)
+
+            for parent, child in original.edges():
+                a, b = top[parent.label], top[child.label]
+                self.assertTrue(a == b or graph.depends_on(b, a))
+
+    def test_write_clusters(self):
+        graph = Graph.from_adjacency({'a': ['b'], 'b': ['c'], 'c': ['d']})
+        graph.transitive_reduction()
+        graph.summarize(1, clusters=True)
+        graph.compress_representation()
+        contents = graph.format_dot()
+
+        self.assertIn('[shape=box3d]', contents)
+        self.assertIn('subgraph cluster_', contents)
+        self.assertIn('"a (1)" -> "b (2)"', contents)
+
+
+class TestDifferential(unittest.TestCase):
+    ''' optimized operations against the reference versions '''
+
+    def test_random(self):
+        fuzzer = Fuzzer(seed=0, size=30)
+        self.assertEqual(fuzzer.run(60), [])
+
+    def test_sources(self):
+        fuzzer = Fuzzer()
+        for name in ('example.bdot', 'references.bdot', 'simple.bdot'):
+            self.assertTrue(fuzzer.check(read_graph(name), name))
+
+    def test_catches_mismatch(self):
+        fuzzer = Fuzzer()
+        contents = fuzzer.generate(0)
+
+        with unittest.mock.patch.object(Graph, 'compress_representation',
+                                        lambda graph: None):
+            self.assertFalse(fuzzer.check(contents))
+
+        self.assertIn('graph: compress_representation: write_dot output '
+                      'differs', fuzzer.failures)
+
+
+class TestDiff(unittest.TestCase):
+    ''' comparing two revisions of a graph '''
+
+    old = template.format(h='1: a\n2: b\n3: c\n4: d', o='',
+                          d='1 -> 2\n2 -> 3\n3 -> 4')
+
+    def test_renumbered(self):
+        # same graph, defined in a different order
+        new = template.format(h='4: d\n3: c\n2: b\n1: a', o='',
+                              d='3 -> 4\n1 -> 2\n2 -> 3')
+        old, new = Graph(self.old), Graph(new)
+
+        self.assertTrue(old.diff(new).empty())
+        self.assertEqual(old.structural_hashes(), new.structural_hashes())
+
+    def test_cleanup(self):
+        # a node inserted at the top, then renumbered by cleanup
+        new = template.format(h='9: zeta\n1: a\n2: b\n3: c\n4: d',
+                              o='cleanup', d='9 -> 1\n1 -> 2\n2 -> 3\n3 -> 4')
+        new = Graph(Graph(new).format_config())
+        changes = Graph(self.old).diff(new)
+
+        self.assertEqual(new.find_node('1').description, 'zeta')
+        self.assertEqual(changes.summary(), '+1 -0 ~0 nodes, +1 -0 edges')
+        self.assertEqual(changes.added, ['1'])
+        self.assertEqual(changes.added_edges, [('1', '2')])
+        self.assertEqual(changes.matched,
+                         {'1': '2', '2': '3', '3': '4', '4': '5'})
+
+        contents = changes.format_dot()
+        self.assertIn('"zeta (1)" [color="palegreen"]', contents)
+        self.assertIn('"d (5)" [color="white"]', contents)
+
+    def test_removed_renumbered(self):
+        # the old node 1 is gone, and the new 1 is the old 2
+        new = template.format(h='1: b\n2: c\n3: d', o='',
+                              d='1 -> 2\n2 -> 3')
+        changes = Graph(self.old).diff(Graph(new))
+
+        self.assertEqual(changes.summary(), '+0 -1 ~0 nodes, +0 -1 edges')
+        self.assertEqual(changes.removed, ['1'])
+        self.assertEqual(changes.removed_edges, [('1', '2')])
+
+        contents = changes.format_dot()
+        self.assertIn('"a (1)" [color="lightcoral"]', contents)
+        self.assertIn('"a (1)" -> "b (1)" [color="red", style=dashed]',
+                      contents)
+
+    def test_changes(self):
+        new = template.format(h='1: a\n3: @c\n4: d\n5: e', o='',
+                              d='1 -> 3\n3 -> 4\n4 -> 5')
+        changes = Graph(self.old).diff(Graph(new))
+
+        self.assertEqual(changes.added, ['5'])
+        self.assertEqual(changes.removed, ['2'])
+        self.assertEqual(changes.changed, ['3'])
+        self.assertEqual(changes.added_edges, [('1', '3'), ('4', '5')])
+        self.assertEqual(changes.removed_edges, [('1', '2'), ('2', '3')])
+        self.assertEqual(changes.summary(), '+1 -1 ~1 nodes, +2 -2 edges')
+
+        contents = changes.format_dot()
+        self.assertIn('"e (5)" [color="palegreen"]', contents)
+        self.assertIn('"b (2)" [color="lightcoral"]', contents)
+        self.assertIn('"c (3)" [color="gold"]', contents)
+        self.assertIn('"d (4)" [color="white"]', contents)
+        self.assertIn('"b (2)" -> "c (3)" [color="red", style=dashed]',
+                      contents)
+
+    def test_structural_hashes(self):
+        new = template.format(h='1: a\n2: b\n3: changed\n4: d', o='',
+                              d='1 -> 2\n2 -> 3\n3 -> 4')
+        old = Graph(self.old).structural_hashes()
+        new = Graph(new).structural_hashes()
+
+        # only the node and its neighbors are affected
+        self.assertEqual([label for label in old if old[label] != new[label]],
+                         ['2', '3', '4'])
+
+
+class TestBudget(unittest.TestCase):
+    ''' cutting reduction and compression short '''
+
+    def test_unlimited(self):
+        expected = dag_graph(random_dag(0))
+        expected.transitive_reduction()
+        expected.compress_representation()
+
+        graph = dag_graph(random_dag(0))
+        graph.transitive_reduction(Budget(seconds=60))
+        graph.compress_representation(Budget(steps=10 ** 6))
+
+        self.assertFalse(graph.truncated)
+        self.assertEqual(graph.format_config(), expected.format_config())
+
+    def test_cancelled(self):
+        graph = dag_graph(random_dag(0))
+        before = edge_labels(graph)
+        budget = Budget()
+        budget.cancel()
+
+        graph.transitive_reduction(budget)
+        self.assertTrue(graph.truncated)
+        self.assertFalse(graph.reduced)
+        self.assertEqual(edge_labels(graph), before)
+
+    def test_partial_reduction(self):
+        for seed in range(5):
+            full = dag_graph(random_dag(seed))
+            full.transitive_reduction()
+
+            for steps in (1, 5, 10):
+                graph = dag_graph(random_dag(seed))
+                expected = Fuzzer.closure(graph)
+                graph.transitive_reduction(Budget(steps=steps))
+
+                self.assertTrue(graph.truncated)
+                self.assertEqual(Fuzzer.closure(graph), expected)
+                self.assertTrue(edge_labels(full) <= edge_labels(graph))
+
+    def test_partial_compression(self):
+        for seed in range(5):
+            graph = dag_graph(random_dag(seed))
+            graph.transitive_reduction()
+            before = edge_labels(graph)
+
+            graph.compress_representation(Budget(steps=5))
+            self.assertTrue(graph.truncated)
+
+            # every relationship is written exactly once
+            written = [(parent, child)
+                       for child in graph.nodes for parent in child.requires]
+            written += [(parent, child)
+                        for parent in graph.nodes for child in parent.provides]
+            self.assertEqual(len(written), len(set(written)))
+            self.assertEqual(edge_labels(graph), before)
+
+    def test_steps_counted(self):
+        # node i's search visits the nodes i + 2 through 30
+        graph = dag_graph([(i, i + 1) for i in range(1, 30)], size=30)
+        budget = Budget(steps=10 ** 6)
+        graph.transitive_reduction(budget)
+
+        self.assertEqual(budget.spent, 30 + sum(range(29)))
+
+        graph = dag_graph([(i, i + 1) for i in range(1, 30)], size=30)
+        graph.transitive_reduction(Budget(steps=100))
+        self.assertTrue(graph.truncated)
+
+    def test_shared(self):
+        budget = Budget(steps=10)
+        graph = dag_graph(random_dag(0))
+
+        graph.transitive_reduction(budget)
+        graph.compress_representation(budget)
+        self.assertTrue(budget.exhausted)
+        self.assertTrue(graph.truncated)
+
+    def test_deadline(self):
+        graph = dag_graph(random_dag(0))
+        graph.transitive_reduction(Budget(seconds=-1))
+        self.assertTrue(graph.truncated)
+
+
+class TestStore(unittest.TestCase):
+    ''' graphs kept in SQLite instead of in memory '''
+
+    def store(self, contents, batch_size=10000):
+        store = Store(batch_size=batch_size)
+        store.parse(contents.splitlines())
+        self.addCleanup(store.close)
+        return store
+
+    def test_same_as_graph(self):
+        for name in ('example.bdot', 'references.bdot', 'simple.bdot'):
+            for batch_size in (1, 3, 10000):
+                contents = read_graph(name)
+                graph = Graph(contents)
+                graph.handle_options()
+                graph.transitive_reduction()
+
+                store = self.store(contents, batch_size)
+                store.handle_options()
+                store.transitive_reduction()
+
+                self.assertEqual(
+                    sorted(store.edges()),
+                    sorted((parent.label, child.label)
+                           for parent, child in graph.edges()))
+
+    def test_random(self):
+        fuzzer = Fuzzer(seed=1)
+        for seed in range(20):
+            contents = fuzzer.generate(seed, cyclic=False)
+            graph = Graph(contents)
+            graph.transitive_reduction()
+
+            store = self.store(contents, batch_size=4)
+            store.transitive_reduction()
+
+            self.assertEqual(
+                sorted(store.edges()),
+                sorted((parent.label, child.label)
+                       for parent, child in graph.edges()))
+
+    def test_cycle(self):
+        store = self.store(template.format(
+            h='1: a\n2: b\n3: c', o='', d='1 -> 2\n2 -> 3\n3 -> 1'), 1)
+        store.transitive_reduction()
+
+        self.assertTrue(store.has_cycle)
+        self.assertFalse(store.reduced)
+
+    def test_options(self):
+        store = self.store(template.format(
+            h='1: @a\n2: b\n3: c\n4: &d', o='color_next remove_marked',
+            d='1 -> 2\n2 -> 3\n4 -> 2'))
+        store.handle_options()
+
+        self.assertEqual(store.count(), (3, 2))
+        self.assertEqual(
+            dict(store.db.execute('select label, flag from nodes')),
+            {'1': '@', '2': '_', '3': ''})
+
+    def test_errors(self):
+        for contents in ('include other.bdot',
+                         template.format(h='1: a\n1: b', o='', d=''),
+                         template.format(h='1: a', o='', d='1 -> 2'),
+                         template.format(h='1: a', o='bogus', d='')):
+            with self.assertRaises(BdgraphRuntimeError):
+                self.store(contents)
+
+    def test_write_dot(self):
+        store = self.store(simple)
+        store.handle_options()
+        store.transitive_reduction()
+
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, 'simple.dot')
+            self.assertTrue(store.write_dot(file_name))
+            self.assertFalse(store.write_dot(file_name))
+
+        fd = io.StringIO()
+        store.write(fd)
+        contents = fd.getvalue()
+
+        self.assertIn('"sauce (2)" -> "apple (1)"', contents)
+        self.assertIn('"sauce (2)" [color="lightskyblue"]', contents)
+
+
+class TestLayout(unittest.TestCase):
+    ''' drawing graphs without graphviz '''
+
+    def test_layers(self):
+        graph = Graph(read_graph('example.bdot'))
+        graph.transitive_reduction()
+        layout = Layout(graph)
+
+        depths = graph.depths()
+        for node in graph.nodes:
+            self.assertEqual(layout.layer[node], depths[node])
+
+        # relationships always point right
+        for parent, child in graph.edges():
+            self.assertLess(layout.x[parent] + layout.size[parent][0],
+                            layout.x[child])
+
+    def test_crossings(self):
+        graph = Graph(template.format(
+            h='1: a\n2: b\n3: c\n4: d', o='', d='1 -> 4\n2 -> 3'))
+        layout = Layout(graph)
+        a, b, c, d = graph.nodes
+
+        self.assertEqual(layout.layers, [[a, b], [d, c]])
+        self.assertLess(layout.y[d], layout.y[c])
+
+        # without any sweeps, the relationships cross
+        layout = Layout(graph, sweeps=0)
+        self.assertEqual(layout.layers, [[a, b], [c, d]])
+
+    def test_cycle(self):
+        graph = Graph(template.format(
+            h='1: a\n2: b\n3: c\n4: d', o='',
+            d='1 -> 2\n2 -> 3\n3 -> 2\n3 -> 4'))
+        layout = Layout(graph)
+
+        self.assertEqual(sorted(layout.layer.values()), [0, 1, 2, 3])
+        self.assertEqual(len(layout.x), 4)
+
+    def test_write_svg(self):
+        graph = Graph(template.format(
+            h='1: fish & <chips>\n2: @peas\n3: !gravy', o='color_complete',
+            d='1 -> 2\n2 -> 3'))
+
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, 'graph.svg')
+            self.assertTrue(graph.write_svg(file_name))
+            self.assertFalse(graph.write_svg(file_name))
+
+        fd = io.StringIO()
+        Layout(graph).write(fd)
+        contents = fd.getvalue()
+
+        self.assertIn('>fish &amp;</text><text x="68.5" y="55.0">'
+                      '&lt;chips&gt; (1)<', contents)
+        self.assertIn('fill="springgreen"', contents)
+        self.assertNotIn('crimson', contents)
+        self.assertEqual(contents.count('class="edge"'), 2)
+
+    def test_empty(self):
+        graph = Graph(template.format(
+            h='1: &a\n2: &b', o='remove_marked', d='1 -> 2'))
+        graph.handle_options()
+        layout = Layout(graph)
+
+        self.assertEqual(graph.nodes, [])
+        self.assertEqual((layout.width, layout.height),
+                         (2 * Layout.margin, 2 * Layout.margin))
+
+        fd = io.StringIO()
+        layout.write(fd)
+        self.assertIn('width="40" height="40"', fd.getvalue())
+        self.assertTrue(fd.getvalue().endswith('</svg>\n'))
+
+
+class TestExport(unittest.TestCase):
+    ''' JSON Lines and TSV output '''
+
+    contents = template.format(
+        h='1: @a [2]\n2: b\n3: c\n4: d', o='color_complete color_next',
+        d='1 -> 2\n2 -> 3\n3 -> 2\n3 -> 4')
+
+    def format(self, graph, extension):
+        fd = io.StringIO()
+        getattr(Exporter(graph), extension[1:])(fd)
+        return fd.getvalue()
+
+    def test_jsonl(self):
+        graph = Graph(self.contents)
+        graph.handle_options()
+        records = [json.loads(_)
+                   for _ in self.format(graph, '.jsonl').splitlines()]
+
+        header, nodes, edges = records[0], records[1:5], records[5:]
+        self.assertEqual(header['type'], 'graph')
+        self.assertEqual(header['options'], ['color_complete', 'color_next'])
+        self.assertEqual((header['nodes'], header['edges']), (4, 4))
+        self.assertTrue(header['has_cycle'])
+
+        self.assertEqual([_['label'] for _ in nodes], ['1', '2', '3', '4'])
+        self.assertEqual([_['option'] for _ in nodes],
+                         ['color_complete', None, None, None])
+        self.assertEqual(nodes[0]['weight'], 2)
+        self.assertEqual([_['cyclic'] for _ in nodes],
+                         [False, True, True, False])
+        self.assertEqual(nodes[1]['component'], nodes[2]['component'])
+
+        # components are in topological order
+        self.assertLess(nodes[0]['component'], nodes[1]['component'])
+        self.assertLess(nodes[2]['component'], nodes[3]['component'])
+
+        self.assertEqual([(_['from'], _['to'], _['cyclic']) for _ in edges],
+                         [('1', '2', False), ('2', '3', True),
+                          ('3', '2', True), ('3', '4', False)])
+
+    def test_tsv(self):
+        graph = Graph(self.contents)
+        graph.handle_options()
+        rows = [_.split('\t') for _ in self.format(graph, '.tsv').splitlines()]
+        component = Exporter(graph).component[graph.nodes[1]]
+
+        self.assertEqual(rows, [
+            ['from', 'to', 'from_option', 'to_option', 'component'],
+            ['1', '2', 'color_complete', '', ''],
+            ['2', '3', '', '', str(component)],
+            ['3', '2', '', '', str(component)],
+            ['3', '4', '', '', '']])
+
+    def test_escaping(self):
+        graph = Graph.from_nodes_edges(
+            [('a\tb', 'tab'), ('c\\d', 'backslash')], [('a\tb', 'c\\d')])
+        rows = self.format(graph, '.tsv').splitlines()
+
+        self.assertEqual(rows[1], 'a\\tb\tc\\\\d\t\t\t')
+
+    def test_compressed(self):
+        graph = Graph(read_graph('example.bdot'))
+        graph.handle_options()
+        graph.transitive_reduction()
+        before = self.format(graph, '.tsv')
+
+        graph.compress_representation()
+        self.assertEqual(sorted(self.format(graph, '.tsv').splitlines()),
+                         sorted(before.splitlines()))
+
+    def test_write(self):
+        graph = Graph(self.contents)
+        graph.handle_options()
+
+        with tempfile.TemporaryDirectory() as directory:
+            for extension in ('.jsonl', '.tsv'):
+                file_name = os.path.join(directory, 'graph' + extension)
+                writer = getattr(graph, 'write_' + extension[1:])
+
+                self.assertTrue(writer(file_name))
+                self.assertFalse(writer(file_name))
+
+                with open(file_name) as fd:
+                    self.assertEqual(fd.read(),
+                                     self.format(graph, extension))
+
+
 class TestGraphOption(unittest.TestCase):
     ''' graph options '''
 